@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+benchmark_pipeline.py
+
+Measures how the generator scales, on synthetic csv files (see synthetic_csv.py) of 1k, 10k and 100k rows.
+The real generator (generate_website_content.py) is run on every csv, in a folder of its own with a copy of the
+template and of filter_options.json, with --stats-json: the times of its stages (timed_stage, see build_stats.py,
+like read_csv, validate, related_datasets, render_datasets, write_index...) and its peak memory are taken from there.
+
+Every size runs in its own process, so that the peak memory of one size doesn't hide the next one.
+The results are written to a json file, and compared with benchmarks/baseline.json:
+if a stage got slower by more than --tolerance, the run fails (exit code 1).
+
+Usage (from the top-level directory):
+ python benchmarks/benchmark_pipeline.py
+ python benchmarks/benchmark_pipeline.py --sizes 1000 10000 --output benchmark_results.json
+ python benchmarks/benchmark_pipeline.py --sizes 1000 10000 --repeat 3 --update-baseline
+
+The timings of a single run can be a lot slower on a busy machine, --repeat keeps the fastest of several runs.
+
+The render cache is disabled, otherwise the second run would not render any markdown.
+"""
+
+import argparse
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BENCHMARKS_FOLDER = Path(__file__).resolve().parent
+REPOSITORY_FOLDER = BENCHMARKS_FOLDER.parent
+BASELINE_PATH = BENCHMARKS_FOLDER / "baseline.json"
+GENERATOR_PATH = REPOSITORY_FOLDER / "python_scripts" / "generate_website_content.py"
+
+sys.path.insert(0, str(BENCHMARKS_FOLDER))
+sys.path.insert(0, str(REPOSITORY_FOLDER / "python_scripts"))
+
+from paths import CSV_PATH, TEMPLATE_FILE, FILTER_OPTIONS_FILE
+from synthetic_csv import write_synthetic_csv
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+# stages faster than this are not compared with the baseline, they are mostly noise
+MIN_SECONDS_TO_COMPARE = 0.05
+
+
+def make_build_folder(build_folder: Path, row_count: int):
+    """ A folder the generator can run in: a synthetic csv, and the other inputs copied from the repository"""
+    for input_path in (TEMPLATE_FILE, FILTER_OPTIONS_FILE):
+        (build_folder / input_path).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(REPOSITORY_FOLDER / input_path, build_folder / input_path)
+    write_synthetic_csv(build_folder / CSV_PATH, row_count)
+
+
+def run_generator(row_count: int) -> dict:
+    """ Makes a synthetic csv with row_count rows, runs the generator on it in a new process, and returns its stats"""
+    with tempfile.TemporaryDirectory() as temporary_folder:
+        build_folder = Path(temporary_folder)
+        make_build_folder(build_folder, row_count)
+        stats_path = build_folder / "build_stats.json"
+
+        # the generator uses paths relative to the top-level directory, so it runs in the build folder
+        completed_process = subprocess.run(
+            [sys.executable, str(GENERATOR_PATH), "--quiet", "--no-render-cache", "--stats-json", str(stats_path)],
+            cwd=build_folder, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if completed_process.returncode != 0:
+            print(completed_process.stderr)
+            raise SystemExit(f"The generator failed on {row_count} rows")
+        return json.loads(stats_path.read_text(encoding="utf-8"))
+
+
+def benchmark_size(row_count: int, repeat: int = 1) -> dict:
+    """ Runs the generator repeat times on row_count rows, and keeps the fastest time of every stage"""
+    all_build_stats = [run_generator(row_count) for _ in range(repeat)]
+    stage_seconds = {stage_name: min(build_stats["stages"][stage_name]["wall_seconds"]
+                                     for build_stats in all_build_stats)
+                     for stage_name in all_build_stats[0]["stages"]}
+    peak_memories = [build_stats["peak_memory_mb"] for build_stats in all_build_stats]
+    return {
+        "rows": row_count,
+        "stages": {stage_name: {"seconds": seconds, "rows_per_second": row_count / seconds if seconds else None}
+                   for stage_name, seconds in stage_seconds.items()},
+        "fields": {field_name: min(build_stats["fields"][field_name] for build_stats in all_build_stats)
+                   for field_name in all_build_stats[0]["fields"]},
+        "total_seconds": sum(stage_seconds.values()),
+        "peak_memory_mb": None if None in peak_memories else max(peak_memories),
+    }
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for size, size_results in results.items():
+        baseline_size_results = baseline.get(size)
+        if baseline_size_results is None:
+            continue
+
+        for stage_name, stage_results in size_results["stages"].items():
+            baseline_stage = baseline_size_results["stages"].get(stage_name)
+            if baseline_stage is None or baseline_stage["seconds"] < MIN_SECONDS_TO_COMPARE:
+                continue
+            if stage_results["seconds"] > baseline_stage["seconds"] * (1 + tolerance):
+                regressions.append(f"{size} rows, {stage_name}: {stage_results['seconds']:.3f}s "
+                                   f"(baseline {baseline_stage['seconds']:.3f}s)")
+
+        peak_memory, baseline_peak_memory = size_results["peak_memory_mb"], baseline_size_results["peak_memory_mb"]
+        if peak_memory and baseline_peak_memory and peak_memory > baseline_peak_memory * (1 + tolerance):
+            regressions.append(f"{size} rows, peak memory: {peak_memory:.0f}MB (baseline {baseline_peak_memory:.0f}MB)")
+    return regressions
+
+
+def print_results(results: dict):
+    for size, size_results in results.items():
+        print(f"{size} rows: {size_results['total_seconds']:.2f}s in total, "
+              f"peak memory {size_results['peak_memory_mb'] or 0:.0f}MB")
+        for stage_name, stage_results in size_results["stages"].items():
+            print(f"    {stage_name:<28} {stage_results['seconds']:8.3f}s  "
+                  f"{stage_results['rows_per_second'] or 0:12.0f} rows/s")
+        for field_name, seconds in size_results["fields"].items():
+            print(f"    (field) {field_name:<20} {seconds:8.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times every stage of the generator on synthetic csv files.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="numbers of rows")
+    parser.add_argument("--output", type=Path, default=Path("benchmark_results.json"),
+                        help="where to write the results")
+    parser.add_argument("--tolerance", type=float, default=0.3,
+                        help="a stage fails if it is this much slower than the baseline (0.3 means 30%%)")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="run the generator this many times for every size, and keep the fastest time of every stage")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="save the results as the new baseline of the sizes that were run")
+    args = parser.parse_args()
+
+    # the keys are strings so that they are the same after going through json
+    results = {str(row_count): benchmark_size(row_count, args.repeat) for row_count in args.sizes}
+    print_results(results)
+    args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"Wrote the results to {args.output}")
+
+    if args.update_baseline:
+        # the other sizes keep their baseline
+        baseline = json.loads(BASELINE_PATH.read_text(encoding="utf-8")) if BASELINE_PATH.exists() else dict()
+        baseline.update(results)
+        baseline = {size: baseline[size] for size in sorted(baseline, key=int)}
+        BASELINE_PATH.write_text(json.dumps(baseline, indent=2), encoding="utf-8")
+        print(f"Updated the baseline at {BASELINE_PATH}")
+        return
+
+    if not BASELINE_PATH.exists():
+        print("There is no baseline to compare with, make one with --update-baseline")
+        return
+
+    regressions = find_regressions(results, json.loads(BASELINE_PATH.read_text(encoding="utf-8")), args.tolerance)
+    if regressions:
+        print("Slower than the baseline:")
+        for regression in regressions:
+            print("    " + regression)
+        sys.exit(1)
+    print("No regressions compared with the baseline.")
+
+
+if __name__ == "__main__":
+    main()
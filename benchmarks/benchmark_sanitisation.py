@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+benchmark_sanitisation.py
+
+Compares the sanitisation stage of dataset_df_row_to_JSON (html_sanitisation.sanitise_dataset_variables)
+with the way it was done before: the linkification of data_collection_methodology, and then the regex of the
+dangerous tags on every text attribute, including the long markdown descriptions that don't contain any tag.
+
+The attributes are made from the rows of a synthetic csv (see synthetic_csv.py), with the descriptions made
+--description-repeat times longer, and dangerous tags added to a few of them.
+Both ways must give the same attributes, otherwise the benchmark fails.
+
+Usage (from the top-level directory):
+ python benchmarks/benchmark_sanitisation.py
+ python benchmarks/benchmark_sanitisation.py --rows 5000 --description-repeat 20
+"""
+
+import argparse
+import html
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCHMARKS_FOLDER = Path(__file__).resolve().parent
+REPOSITORY_FOLDER = BENCHMARKS_FOLDER.parent
+sys.path.insert(0, str(BENCHMARKS_FOLDER))
+sys.path.insert(0, str(REPOSITORY_FOLDER / "python_scripts"))
+
+from html_sanitisation import sanitise_dataset_variables, remove_dangerous_tags, convert_str_in_HTML_with_clickable_links
+from read_csv_safely import iterate_csv_rows
+from synthetic_csv import write_synthetic_csv
+
+DANGEROUS_SNIPPETS = ['<script>alert(1)</script>', '<iframe src="https://example.org">', '<SVG onload=x>',
+                      '<style>body {}</style>']
+
+
+def sanitise_every_field(dataset_variables: dict) -> bool:
+    """ The sanitisation as it was done before html_sanitisation.py, returns whether something was removed"""
+    dataset_variables["data_collection_methodology"] = convert_str_in_HTML_with_clickable_links(
+        dataset_variables["data_collection_methodology"])
+
+    removed_dangerous_tags = False
+    for key in dataset_variables:
+        if key == "description":
+            continue
+        old_content = dataset_variables[key]
+        if isinstance(old_content, str):
+            new_content = remove_dangerous_tags(old_content)
+            dataset_variables[key] = new_content
+            removed_dangerous_tags = removed_dangerous_tags or old_content != new_content
+    return removed_dangerous_tags
+
+
+def make_dataset_variables(row_count: int, description_repeat: int, dangerous_fraction: float) -> list[dict]:
+    """ Attributes like the ones of dataset_df_row_to_JSON just before the sanitisation"""
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as temporary_folder:
+        csv_path = Path(temporary_folder) / "database_information.csv"
+        write_synthetic_csv(csv_path, row_count)
+        rows = [row_dict for _, row_dict in iterate_csv_rows(csv_path)]
+
+    all_dataset_variables = []
+    for row_dict in rows:
+        dataset_variables = dict(row_dict)
+        dataset_variables["long_description_from_questionnaire"] = "\n\n".join(
+            [row_dict["long_description_from_questionnaire"]] * description_repeat)
+        if rng.random() < dangerous_fraction:
+            key = rng.choice(["long_description_from_questionnaire", "data_collection_methodology",
+                              "usage_instructions", "author_name"])
+            dataset_variables[key] += " " + rng.choice(DANGEROUS_SNIPPETS) + " www.example.org/after"
+
+        dataset_variables["dataset_title"] = html.escape(row_dict["dataset_title"])
+        dataset_variables["abstract"] = html.escape(row_dict["abstract"])
+        dataset_variables["abstract_escaped_for_schema"] = repr(dataset_variables["abstract"])
+        # already sanitised, both ways skip it
+        dataset_variables["description"] = "<p>" + dataset_variables["long_description_from_questionnaire"] + "</p>"
+        all_dataset_variables.append(dataset_variables)
+    return all_dataset_variables
+
+
+def time_sanitisation(sanitise_function, all_dataset_variables: list[dict]) -> (float, list[dict], int):
+    copies = [dict(dataset_variables) for dataset_variables in all_dataset_variables]
+    start_time = time.perf_counter()
+    rows_with_removed_tags = sum(1 for dataset_variables in copies if sanitise_function(dataset_variables))
+    return time.perf_counter() - start_time, copies, rows_with_removed_tags
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times the sanitisation stage against the old one.")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--description-repeat", type=int, default=10,
+                        help="how many times longer than the synthetic ones the descriptions are")
+    parser.add_argument("--dangerous-fraction", type=float, default=0.05,
+                        help="fraction of the rows where a dangerous tag is added")
+    args = parser.parse_args()
+
+    all_dataset_variables = make_dataset_variables(args.rows, args.description_repeat, args.dangerous_fraction)
+    old_seconds, old_results, old_rows_with_removed_tags = time_sanitisation(sanitise_every_field,
+                                                                             all_dataset_variables)
+    new_seconds, new_results, new_rows_with_removed_tags = time_sanitisation(sanitise_dataset_variables,
+                                                                             all_dataset_variables)
+
+    if old_results != new_results or old_rows_with_removed_tags != new_rows_with_removed_tags:
+        print("The sanitisation stage doesn't give the same attributes as before!")
+        sys.exit(1)
+
+    description_length = sum(len(dataset_variables["long_description_from_questionnaire"])
+                             for dataset_variables in all_dataset_variables) / len(all_dataset_variables)
+    print(f"{args.rows} rows, descriptions of {description_length:.0f} characters on average, "
+          f"dangerous tags removed in {new_rows_with_removed_tags} rows")
+    print(f"    {'every field (before)':<28} {old_seconds:8.3f}s")
+    print(f"    {'sanitise_dataset_variables':<28} {new_seconds:8.3f}s  ({old_seconds / new_seconds:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
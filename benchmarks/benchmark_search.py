@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+benchmark_search.py
+
+Checks that python_scripts/search.py gives the same results as the search page, and measures how fast it is.
+
+ - parity: the search index and the listing are made from website_metadata/database_index.json, and every query
+   of QUERIES is run with every filter of FILTER_SETS, by search.py and by doSearch of search_results_script.js
+   (with node), once with the search index and once without it (doSearch then scans database_index.json with
+   filterData and scoreResults, like before the search index).
+   The ids of the results must be the same, in the same order, otherwise the benchmark fails.
+   Without node the benchmark fails too, unless --skip-parity is given (then only the timing is done).
+ - timing: the datasets of database_index.json are copied --rows times (with other words in the names and abstracts),
+   and the queries are timed, keeping the best -k results.
+
+Usage (from the top-level directory):
+ python benchmarks/benchmark_search.py
+ python benchmarks/benchmark_search.py --rows 100000 -k 20
+ python benchmarks/benchmark_search.py --skip-parity
+"""
+
+import argparse
+import json
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCHMARKS_FOLDER = Path(__file__).resolve().parent
+REPOSITORY_FOLDER = BENCHMARKS_FOLDER.parent
+sys.path.insert(0, str(BENCHMARKS_FOLDER))
+sys.path.insert(0, str(REPOSITORY_FOLDER / "python_scripts"))
+
+from index_output import LISTING_KEYS, SHARD_KEY
+from search import SearchEngine
+from search_index import build_search_index
+from synthetic_csv import WORDS
+
+INDEX_PATH = REPOSITORY_FOLDER / "website_metadata" / "database_index.json"
+SEARCH_SCRIPT_PATH = REPOSITORY_FOLDER / "website_contents" / "search_results" / "search_results_script.js"
+METADATA_URLS_SCRIPT_PATH = REPOSITORY_FOLDER / "website_contents" / "shared" / "metadata_urls.js"
+
+QUERIES = ["food", "scot", "survey data", "a", "", "e", "uk biobank", "2016", "&amp;", "nutrition health diet"]
+FILTER_SETS = [
+    {"publiclyAvailable": ""},
+    {"publiclyAvailable": True},
+    {"publiclyAvailable": False},
+    {"publiclyAvailable": None},
+    {"publiclyAvailable": "", "category": ["Nutrition"]},
+    {"publiclyAvailable": "", "location": ["Scotland"], "dataType": ["Numeric / Quantitative", "Maps / Spatial"]},
+    {"publiclyAvailable": "", "mandatoryKeywords": "food, health"},
+    {"publiclyAvailable": "", "fileExtensions": "csv, xlsx"},
+    {"publiclyAvailable": "", "collectionStart": {"type": "after", "date": "2010-01-01"}},
+    {"publiclyAvailable": "", "collectionEnd": {"type": "before", "date": "2020-06"}},
+    {"publiclyAvailable": "", "openForCollaboration": True},
+]
+
+# runs doSearch for every query and filter set, with fetch reading the files of the folder given as argument
+NODE_SCRIPT = """
+const fs = require('fs');
+const [metadataUrlsScriptPath, scriptPath, folder, queriesJson, filterSetsJson] = process.argv.slice(2);
+global.fetch = async (url) => {
+  const path = folder + '/' + url.replace('../../website_metadata/', '');
+  return {ok: fs.existsSync(path), json: async () => JSON.parse(fs.readFileSync(path, 'utf8'))};
+};
+console.warn = () => {};
+eval(fs.readFileSync(metadataUrlsScriptPath, 'utf8') + "\\n" + fs.readFileSync(scriptPath, 'utf8')
+     + "\\n;global.doSearch = doSearch;");
+(async () => {
+  const results = [];
+  for (const query of JSON.parse(queriesJson)) {
+    for (const filters of JSON.parse(filterSetsJson)) {
+      results.push((await doSearch(query, filters)).map(item => item.id));
+    }
+  }
+  console.log(JSON.stringify(results));
+})();
+"""
+
+
+def make_listing(index_list: list[dict]) -> list[dict]:
+    """ database_listing.json for the entries (all in shard 0, the details are not needed)"""
+    return [{**{short_key: entry.get(attribute) for attribute, short_key in LISTING_KEYS.items()}, SHARD_KEY: 0}
+            for entry in index_list if entry.get("allowed_in_database")]
+
+
+def run_javascript_searches(metadata_files: dict):
+    """
+    The ids of the results of doSearch for every query and filter set, None if node is not installed.
+    metadata_files is {name: content} of the files in website_metadata: with search_index.json and
+    database_listing.json doSearch uses the search index, with database_index.json only it scans every dataset.
+    """
+    node_path = shutil.which("node")
+    if node_path is None:
+        return None
+    with tempfile.TemporaryDirectory() as temporary_folder:
+        temporary_folder = Path(temporary_folder)
+        for file_name, content in metadata_files.items():
+            (temporary_folder / file_name).write_text(json.dumps(content), encoding="utf-8")
+        (temporary_folder / "run_searches.js").write_text(NODE_SCRIPT, encoding="utf-8")
+        output = subprocess.run([node_path, str(temporary_folder / "run_searches.js"),
+                                 str(METADATA_URLS_SCRIPT_PATH), str(SEARCH_SCRIPT_PATH),
+                                 str(temporary_folder), json.dumps(QUERIES), json.dumps(FILTER_SETS)],
+                                check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def check_parity(index_list: list[dict]) -> bool:
+    search_index = build_search_index(index_list)
+    listing = make_listing(index_list)
+    javascript_searches = {
+        "with the search index": run_javascript_searches({"search_index.json": search_index,
+                                                          "database_listing.json": listing}),
+        "without the search index": run_javascript_searches({"database_index.json": index_list}),
+    }
+    if None in javascript_searches.values():
+        print("node is not installed, the results can't be compared with search_results_script.js "
+              "(use --skip-parity to only time the searches)")
+        return False
+
+    search_engine = SearchEngine(search_index, listing)
+    searches = [(query, filters) for query in QUERIES for filters in FILTER_SETS]
+    python_results = [[result["record"]["id"] for result in search_engine.search(query, filters, k=len(listing))]
+                      for query, filters in searches]
+    is_same = True
+    for javascript_search_name, javascript_results in javascript_searches.items():
+        different_searches = [(query, filters) for (query, filters), python_ids, javascript_ids
+                              in zip(searches, python_results, javascript_results) if python_ids != javascript_ids]
+        for query, filters in different_searches:
+            print(f"Different results for {query!r} with {filters} ({javascript_search_name})")
+        print(f"{len(python_results)} searches compared with search_results_script.js {javascript_search_name}, "
+              f"{len(different_searches)} different")
+        is_same = is_same and not different_searches
+    return is_same
+
+
+def make_large_index_list(index_list: list[dict], row_count: int) -> list[dict]:
+    """ row_count entries, copied from index_list with some words of the name and abstract replaced"""
+    rng = random.Random(0)
+    large_index_list = []
+    for number in range(row_count):
+        entry = dict(index_list[number % len(index_list)])
+        entry["id"] = f"{number + 1:05d}"
+        entry["name"] = " ".join(rng.sample(WORDS, 4)) + " " + entry["name"]
+        entry["abstract"] = " ".join(rng.choices(WORDS, k=30))
+        large_index_list.append(entry)
+    return large_index_list
+
+
+def time_searches(index_list: list[dict], k: int):
+    start_time = time.perf_counter()
+    search_engine = SearchEngine(build_search_index(index_list), make_listing(index_list))
+    print(f"{len(search_engine.ids)} datasets, search engine ready in {time.perf_counter() - start_time:.2f}s")
+
+    for query in QUERIES:
+        result_count = search_engine.count_results(query, FILTER_SETS[0])
+        start_time = time.perf_counter()
+        search_engine.search(query, FILTER_SETS[0], k)
+        seconds = time.perf_counter() - start_time
+        print(f"    {query!r:<26} {result_count:8d} results  {seconds * 1000:8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares search.py with the search page, and times it.")
+    parser.add_argument("--rows", type=int, default=100000, help="number of datasets for the timing")
+    parser.add_argument("-k", type=int, default=20, help="number of results kept")
+    parser.add_argument("--skip-parity", action="store_true",
+                        help="don't compare the results with search_results_script.js")
+    args = parser.parse_args()
+
+    with open(INDEX_PATH, "r", encoding="utf-8") as file:
+        index_list = json.load(file)
+
+    if args.skip_parity:
+        print("The results are not compared with search_results_script.js")
+    elif not check_parity(index_list):
+        sys.exit(1)
+    time_searches(make_large_index_list(index_list, args.rows), args.k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import csv
+import json
+import random
+import sys
+from pathlib import Path
+
+"""
+ Makes a fake database_information.csv with any number of rows, to measure how the generator scales.
+
+ The rows look like the real ones: same two-row header as the real csv, hierarchical categories written
+ like the questionnaire writes them, countries and data types taken from filter_options.json,
+ markdown long descriptions and dd/mm/yyyy dates.
+ The same seed always gives the same file.
+
+ Usage:
+     python benchmarks/synthetic_csv.py 10000 synthetic.csv
+"""
+
+REPOSITORY_FOLDER = Path(__file__).resolve().parent.parent
+REAL_CSV_PATH = REPOSITORY_FOLDER / "database_information.csv"
+FILTER_OPTIONS_PATH = REPOSITORY_FOLDER / "website_metadata" / "filter_options.json"
+
+WORDS = ("food nutrition survey household consumption price retail crop soil yield livestock cattle poultry fish "
+         "marine supply chain storage transport waste emissions climate water quality safety hygiene diet health "
+         "children elders income region farm census panel weekly annual sample respondents measurement").split()
+
+FILE_EXTENSIONS = ["csv", "xlsx", "json", "pdf", "zip", "txt", "shp", "sav", "dta", "parquet"]
+LIFECYCLE_STAGES = ["Complete", "Incomplete", "Continuously updated", "Open for collaboration"]
+SHAREABILITIES = ["Publicly shareable", "Shareable on request"]
+
+
+def read_real_header() -> (list[str], list[str]):
+    """ The first two rows of the real csv: the questions of the form, and the names of the columns"""
+    with open(REAL_CSV_PATH, "r", encoding="utf-8-sig", newline="") as file:
+        csv_reader = csv.reader(file)
+        return next(csv_reader), next(csv_reader)
+
+
+def flatten_tree(tree: dict, depth: int = 0) -> list[(str, int)]:
+    """ [(name, depth)] for every node of a filter options tree, parents before children"""
+    nodes = []
+    for name, children in tree.items():
+        nodes.append((name, depth))
+        nodes.extend(flatten_tree(children, depth + 1))
+    return nodes
+
+
+def format_like_questionnaire(name: str, depth: int) -> str:
+    # the questionnaire shows the hierarchy with these symbols, get_cleaned_categories removes them
+    if depth == 0:
+        return name
+    if depth == 1:
+        return "├──  " + name
+    return "│       " * (depth - 1) + "└──  " + name
+
+
+def make_sentence(rng: random.Random, word_count: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(word_count)).capitalize() + "."
+
+
+def make_markdown_description(rng: random.Random) -> str:
+    lines = [f"# {make_sentence(rng, 4)}", "", make_sentence(rng, 25) + " **" + rng.choice(WORDS) + "** " +
+             make_sentence(rng, 15), ""]
+    lines += [f"- **{rng.choice(WORDS)}**: {make_sentence(rng, 8)}" for _ in range(rng.randint(2, 6))]
+    lines += ["", "## Variables", "", "| name | unit | description |", "| --- | --- | --- |"]
+    lines += [f"| {rng.choice(WORDS)}_{i} | {rng.choice(['kg', 'g', 'GBP', '%', 'count'])} | {make_sentence(rng, 6)} |"
+              for i in range(rng.randint(2, 8))]
+    lines += ["", "```", f"{rng.choice(WORDS)} = load('{rng.choice(WORDS)}.csv')", "```", "",
+              make_sentence(rng, 40), "", f"More at https://example.org/{rng.choice(WORDS)}/{rng.randint(1, 10 ** 6)}"]
+    return "\n".join(lines)
+
+
+def make_date(rng: random.Random) -> str:
+    if rng.random() < 0.15:
+        return ""
+    return f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1970, 2025)}"
+
+
+def make_row(rng: random.Random, row_number: int, column_names: list[str], category_nodes, country_names,
+             datatype_names, research_field_names) -> list[str]:
+    first_category = rng.randrange(len(category_nodes))
+    categories = [format_like_questionnaire(*node)
+                  for node in category_nodes[first_category:first_category + rng.randint(1, 5)]]
+
+    values = {
+        "submission_timestamp": f"{make_date(rng) or '01/01/2024'} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00",
+        "allow": "Allow" if rng.random() < 0.9 else "do not allow",
+        "shareability": rng.choice(SHAREABILITIES),
+        "dataset_links_from_questionnaire": "\n".join(f"https://example.org/data/{row_number}/{i}"
+                                                      for i in range(rng.randint(1, 3))),
+        "dataset_title": f"{make_sentence(rng, rng.randint(3, 8))[:-1]} ({row_number})",
+        "dataset_keywords_from_questionnaire": ", ".join(rng.sample(WORDS, rng.randint(2, 8))),
+        "dataset_categories_from_questionnaire": ", ".join(categories),
+        "research_fields": ", ".join(rng.sample(research_field_names, rng.randint(1, 3))),
+        "author_name": f"{rng.choice(WORDS).capitalize()} {rng.choice(WORDS).capitalize()}",
+        "dataset_datatypes": ", ".join(rng.sample(datatype_names, rng.randint(1, 3))),
+        "abstract": " ".join(make_sentence(rng, 20) for _ in range(rng.randint(1, 5))),
+        "dataset_country": rng.choice(country_names),
+        "data_collection_start": make_date(rng),
+        "data_collection_end": make_date(rng),
+        "dataset_lifecycle_stage": rng.choice(LIFECYCLE_STAGES),
+        "long_description_from_questionnaire": make_markdown_description(rng),
+        "usage_instructions": make_sentence(rng, 10) if rng.random() < 0.5 else "",
+        "file_extensions": ", ".join(rng.sample(FILE_EXTENSIONS, rng.randint(1, 3))),
+        "author_contacts": f"{rng.choice(WORDS)}@example.org",
+        "data_collection_methodology": make_sentence(rng, 20) + f" See www.example.org/{rng.choice(WORDS)}",
+    }
+    return [values.get(column_name, rng.choice(["Yes", "No", ""])) for column_name in column_names]
+
+
+def write_synthetic_csv(csv_path, row_count: int, seed: int = 0):
+    rng = random.Random(seed)
+    questions, column_names = read_real_header()
+
+    with open(FILTER_OPTIONS_PATH, "r", encoding="utf-8") as file:
+        filter_options = json.load(file)
+    category_nodes = flatten_tree(filter_options["category"])
+    country_names = [name for name, _ in flatten_tree(filter_options["location"])]
+    datatype_names = list(filter_options["dataType"])
+    research_field_names = list(filter_options["researchField"])
+
+    with open(csv_path, "w", encoding="utf-8-sig", newline="") as file:
+        csv_writer = csv.writer(file)
+        csv_writer.writerow(questions)
+        csv_writer.writerow(column_names)
+        for row_number in range(row_count):
+            csv_writer.writerow(make_row(rng, row_number, column_names, category_nodes, country_names,
+                                         datatype_names, research_field_names))
+
+
+if __name__ == "__main__":
+    write_synthetic_csv(Path(sys.argv[2]), int(sys.argv[1]))
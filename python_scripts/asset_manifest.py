@@ -0,0 +1,106 @@
+import datetime
+import hashlib
+import json
+import re
+from pathlib import Path
+
+from build_manifest import write_bytes_if_changed, write_text_if_changed
+from build_stats import logger
+from paths import INDEX_PATH, LISTING_INDEX_PATH, SEARCH_INDEX_PATH, FACET_COUNTS_PATH, FILTER_OPTIONS_FILE, \
+    INDEX_MANIFEST_PATH, INDEX_SHARDS_FOLDER, ASSET_MANIFEST_PATH
+
+"""
+ Copies of the files that the website fetches from website_metadata, with the hash of their content in the name
+ (database_index.json -> database_index.3f2a1b9c0d12.json), listed in asset_manifest.json:
+
+     {"files": {"database_index.json": {"path": "database_index.3f2a1b9c0d12.json", "size": ..., "sha256": ...,
+                                        "last_updated": "2025-11-17 10:18:43.335521"}, ...}}
+
+ The pages only check asset_manifest.json again (see website_contents/shared/metadata_urls.js), and fetch the copies,
+ which never change, so the browser can keep them in its cache for as long as it wants.
+ A file keeps its copy and its last_updated when its content doesn't change, so a build that doesn't change
+ anything doesn't change any file either. The copies of the old contents are deleted.
+"""
+
+# long enough that two contents never get the same name
+HASH_LENGTH = 12
+
+# the precompressed copies written by index_output.write_json_output, they get hashed copies too
+PRECOMPRESSED_SUFFIXES = [".gz", ".br"]
+
+# the shards themselves, not their hashed copies
+_SHARD_NAME_RE = re.compile(r"shard_\d+\.json$")
+
+
+def get_served_metadata_files() -> list[Path]:
+    """ The files of website_metadata that the pages fetch"""
+    shard_paths = sorted(shard_path for shard_path in INDEX_SHARDS_FOLDER.glob("shard_*.json")
+                         if _SHARD_NAME_RE.match(shard_path.name))
+    return [INDEX_PATH, LISTING_INDEX_PATH, SEARCH_INDEX_PATH, FACET_COUNTS_PATH, FILTER_OPTIONS_FILE,
+            INDEX_MANIFEST_PATH] + shard_paths
+
+
+def get_fingerprinted_path(path: Path, content_hash: str) -> Path:
+    return path.with_name(f"{path.stem}.{content_hash[:HASH_LENGTH]}{path.suffix}")
+
+
+def _delete_old_fingerprinted_copies(path: Path, current_copy: Path):
+    copy_name_re = re.compile(re.escape(path.stem) + r"\.[0-9a-f]{" + str(HASH_LENGTH) + "}" + re.escape(path.suffix)
+                              + "(" + "|".join(map(re.escape, PRECOMPRESSED_SUFFIXES)) + ")?$")
+    current_copy_names = {current_copy.name} | {current_copy.name + suffix for suffix in PRECOMPRESSED_SUFFIXES}
+    for old_copy in path.parent.glob(f"{path.stem}.*"):
+        if copy_name_re.match(old_copy.name) and old_copy.name not in current_copy_names:
+            old_copy.unlink()
+
+
+def load_asset_manifest() -> dict:
+    try:
+        return json.loads(ASSET_MANIFEST_PATH.read_text(encoding="utf-8"))["files"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return {}
+
+
+def write_fingerprinted_copies() -> bool:
+    """
+    Writes the hashed copies of the served files and asset_manifest.json.
+    Returns True if some content changed since the last build.
+    """
+    old_files = load_asset_manifest()
+    current_time_as_string = str(datetime.datetime.now())
+    files = dict()
+
+    for path in get_served_metadata_files():
+        if not path.exists():
+            continue
+        content = path.read_bytes()
+        content_hash = hashlib.sha256(content).hexdigest()
+        fingerprinted_path = get_fingerprinted_path(path, content_hash)
+
+        write_bytes_if_changed(fingerprinted_path, content)
+        for suffix in PRECOMPRESSED_SUFFIXES:
+            precompressed_path = path.with_name(path.name + suffix)
+            if precompressed_path.exists():
+                write_bytes_if_changed(fingerprinted_path.with_name(fingerprinted_path.name + suffix),
+                                       precompressed_path.read_bytes())
+        _delete_old_fingerprinted_copies(path, fingerprinted_path)
+
+        # the name used by the pages, relative to website_metadata
+        file_name = path.relative_to(ASSET_MANIFEST_PATH.parent).as_posix()
+        old_file = old_files.get(file_name, {})
+        files[file_name] = {
+            "path": fingerprinted_path.relative_to(ASSET_MANIFEST_PATH.parent).as_posix(),
+            "size": len(content),
+            "sha256": content_hash,
+            # only changes with the content
+            "last_updated": old_file["last_updated"] if old_file.get("sha256") == content_hash else current_time_as_string,
+        }
+
+    # the copies of shards that don't exist anymore
+    for file_name in old_files.keys() - files.keys():
+        old_path = ASSET_MANIFEST_PATH.parent / file_name
+        _delete_old_fingerprinted_copies(old_path, old_path)
+
+    changed_count = sum(1 for file_name, file in files.items() if old_files.get(file_name) != file)
+    if changed_count:
+        logger.info(f"{changed_count} files of website_metadata changed, and got new hashed copies.")
+    return write_text_if_changed(ASSET_MANIFEST_PATH, json.dumps({"files": files}, indent=1))
@@ -0,0 +1,102 @@
+import filecmp
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from build_stats import add_to_counter
+from paths import BUILD_MANIFEST_FILE, TEMPLATE_FILE, FILTER_OPTIONS_FILE
+
+"""
+ The build manifest remembers, for every dataset code, a hash of everything that went into its page:
+     * the csv row itself
+     * the related datasets shown on the page (codes and titles, see related_datasets.py)
+     * the webpage template
+     * filter_options.json (it changes the supercategories that get added)
+     * the python scripts that make the pages and the index entries (RENDERING_SCRIPTS), so that changing them
+   rebuilds everything. The other scripts (the search, the preview server...) don't change the pages.
+
+ In incremental mode, rows whose hash did not change are not re-rendered nor re-written.
+ Pages for codes that are in the old manifest but not in the csv anymore are deleted.
+"""
+
+# bump this if the format of the manifest changes, old manifests will be ignored
+MANIFEST_VERSION = 1
+
+PYTHON_SCRIPTS_FOLDER = Path(__file__).parent
+
+# the scripts that a page or an index entry depends on: add the new ones here,
+# or the incremental builds will keep the pages made by the old code
+RENDERING_SCRIPTS = [
+    "build_manifest.py",  # the row hash itself
+    "dataset_rendering.py",
+    "filter_hierarchy.py",
+    "html_sanitisation.py",
+    "parse_dataset_information.py",
+    "webpage_template.py",
+]
+
+
+def compute_build_fingerprint() -> str:
+    """ Hash of all the files that affect every page (template, filter options and the RENDERING_SCRIPTS)"""
+    hasher = hashlib.sha256()
+    shared_inputs = [TEMPLATE_FILE, FILTER_OPTIONS_FILE] + [PYTHON_SCRIPTS_FOLDER / script_name
+                                                            for script_name in RENDERING_SCRIPTS]
+    for input_path in shared_inputs:
+        hasher.update(str(input_path.name).encode("utf-8"))
+        hasher.update(input_path.read_bytes())
+    return hasher.hexdigest()
+
+
+def compute_row_hash(row_dict: dict, build_fingerprint: str, related_datasets: list = None) -> str:
+    """ Hash of a csv row (as a dict) combined with the build fingerprint.
+    Keys are turned into strings since a column without a name is a NaN.
+    The related datasets shown on the page are included, since they change with the other rows."""
+    row_as_text = json.dumps([[str(key), str(value)] for key, value in row_dict.items()], ensure_ascii=False)
+    if related_datasets:
+        row_as_text += json.dumps(related_datasets, ensure_ascii=False)
+    return hashlib.sha256((build_fingerprint + row_as_text).encode("utf-8")).hexdigest()
+
+
+def load_build_manifest() -> dict:
+    """ Returns {dataset_code: {"hash": ..., "allowed": ...}}, or an empty dict if there is no usable manifest"""
+    try:
+        manifest = json.loads(BUILD_MANIFEST_FILE.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest.get("datasets", {})
+
+
+def save_build_manifest(datasets: dict) -> bool:
+    manifest = {"version": MANIFEST_VERSION, "datasets": datasets}
+    return write_text_if_changed(BUILD_MANIFEST_FILE, json.dumps(manifest, indent=1, sort_keys=True))
+
+
+def write_text_if_changed(path: Path, content: str) -> bool:
+    """ Writes the file only if the content is different, so that untouched files keep their timestamp
+    and don't show up in the commit. Returns True if the file was written."""
+    return write_bytes_if_changed(path, content.encode("utf-8"))
+
+
+def write_bytes_if_changed(path: Path, content: bytes) -> bool:
+    try:
+        if path.read_bytes() == content:
+            return False
+    except FileNotFoundError:
+        pass
+    path.write_bytes(content)
+    add_to_counter("bytes_written", len(content))
+    return True
+
+
+def replace_file_if_changed(temporary_path: Path, path: Path) -> bool:
+    """ Same as write_bytes_if_changed, for a file that was written (streamed) to temporary_path first"""
+    if path.exists() and filecmp.cmp(temporary_path, path, shallow=False):
+        temporary_path.unlink()
+        return False
+    add_to_counter("bytes_written", temporary_path.stat().st_size)
+    os.replace(temporary_path, path)
+    return True
@@ -0,0 +1,159 @@
+import contextlib
+import heapq
+import json
+import logging
+import sys
+import time
+from collections import defaultdict
+
+"""
+ Logging and measurements of the generator.
+
+ All the scripts log through `logger`:
+     * DEBUG for the messages about a single dataset (one line per page, which gets slow with many rows)
+     * INFO for the summaries
+     * WARNING for the problems
+ generate_website_content.py --quiet hides the DEBUG messages.
+
+ With --profile or --stats-json, the generator also records
+     * the wall-clock and CPU time of every stage of the build (timed_stage)
+     * the time spent on some fields inside dataset_df_row_to_JSON, like the markdown (timed_field)
+     * counters, like the bytes written and the pages that were skipped or deleted (add_to_counter)
+     * the slowest rows (record_row_seconds)
+     * the peak memory of the main process
+ The worker processes of --jobs send their field times and counters back with their results (see take_worker_stats).
+"""
+
+logger = logging.getLogger("scaf_generator")
+
+SLOWEST_ROWS_KEPT = 10
+
+_field_timing_enabled = False
+_stage_seconds = dict()  # stage name -> {"wall_seconds": ..., "cpu_seconds": ...}
+_field_seconds = defaultdict(float)
+_counters = defaultdict(int)
+_slowest_rows = []  # heap of (seconds, dataset_code, dataset_title)
+
+
+def configure_logging(quiet: bool = False):
+    # only the level of our logger changes, the debug messages of the libraries (markdown...) stay hidden
+    logging.basicConfig(format="%(message)s", level=logging.WARNING)
+    logger.setLevel(logging.INFO if quiet else logging.DEBUG)
+
+
+def enable_field_timing(enabled: bool = True):
+    """ timed_field does nothing unless this is called, since it runs many times per row"""
+    global _field_timing_enabled
+    _field_timing_enabled = enabled
+
+
+def is_field_timing_enabled() -> bool:
+    return _field_timing_enabled
+
+
+@contextlib.contextmanager
+def timed_stage(stage_name: str):
+    start_wall_time, start_cpu_time = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        stage = _stage_seconds.setdefault(stage_name, {"wall_seconds": 0.0, "cpu_seconds": 0.0})
+        stage["wall_seconds"] += time.perf_counter() - start_wall_time
+        stage["cpu_seconds"] += time.process_time() - start_cpu_time
+
+
+def add_stage_cpu_seconds(stage_name: str, cpu_seconds: float):
+    """ For the CPU time spent in the worker processes, which process_time doesn't see"""
+    stage = _stage_seconds.setdefault(stage_name, {"wall_seconds": 0.0, "cpu_seconds": 0.0})
+    stage["cpu_seconds"] += cpu_seconds
+
+
+@contextlib.contextmanager
+def timed_field(field_name: str):
+    if not _field_timing_enabled:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        _field_seconds[field_name] += time.perf_counter() - start_time
+
+
+def add_to_counter(counter_name: str, amount: int = 1):
+    _counters[counter_name] += amount
+
+
+def get_counter(counter_name: str) -> int:
+    return _counters.get(counter_name, 0)
+
+
+def record_row_seconds(dataset_code: str, dataset_title: str, seconds: float):
+    """ Keeps the SLOWEST_ROWS_KEPT slowest rows"""
+    row = (seconds, dataset_code, dataset_title)
+    if len(_slowest_rows) < SLOWEST_ROWS_KEPT:
+        heapq.heappush(_slowest_rows, row)
+    else:
+        heapq.heappushpop(_slowest_rows, row)
+
+
+def take_worker_stats() -> dict:
+    """ In a worker process: the field times and counters since the last call, which are then reset"""
+    worker_stats = {"fields": dict(_field_seconds), "counters": dict(_counters)}
+    _field_seconds.clear()
+    _counters.clear()
+    return worker_stats
+
+
+def merge_worker_stats(worker_stats: dict):
+    """ In the main process: adds what take_worker_stats returned in a worker"""
+    for field_name, seconds in worker_stats["fields"].items():
+        _field_seconds[field_name] += seconds
+    for counter_name, amount in worker_stats["counters"].items():
+        _counters[counter_name] += amount
+
+
+def get_peak_memory_mb():
+    """ Peak resident memory of this process, or None if it can't be measured (on Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on mac
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def get_build_stats() -> dict:
+    return {
+        "peak_memory_mb": get_peak_memory_mb(),
+        "stages": _stage_seconds,
+        "fields": dict(_field_seconds),
+        "counters": dict(_counters),
+        "slowest_rows": [{"dataset_code": dataset_code, "dataset_title": dataset_title, "seconds": seconds}
+                         for seconds, dataset_code, dataset_title in sorted(_slowest_rows, reverse=True)],
+    }
+
+
+def log_build_stats():
+    build_stats = get_build_stats()
+    if build_stats["peak_memory_mb"] is not None:
+        logger.info(f"Peak memory of the main process: {build_stats['peak_memory_mb']:.0f}MB")
+    logger.info("Stages (wall / cpu seconds):")
+    for stage_name, stage in build_stats["stages"].items():
+        logger.info(f"    {stage_name:<20} {stage['wall_seconds']:8.3f} / {stage['cpu_seconds']:8.3f}")
+    if build_stats["fields"]:
+        logger.info("Time spent on fields of dataset_df_row_to_JSON (seconds, summed over all processes):")
+        for field_name, seconds in sorted(build_stats["fields"].items(), key=lambda item: -item[1]):
+            logger.info(f"    {field_name:<20} {seconds:8.3f}")
+    logger.info("Counters:")
+    for counter_name, amount in sorted(build_stats["counters"].items()):
+        logger.info(f"    {counter_name:<20} {amount}")
+    logger.info("Slowest rows:")
+    for row in build_stats["slowest_rows"]:
+        logger.info(f"    {row['seconds']:8.3f}s  {row['dataset_code']} ({row['dataset_title']})")
+
+
+def write_build_stats(stats_path):
+    with open(stats_path, "w", encoding="utf-8") as file:
+        json.dump(get_build_stats(), file, ensure_ascii=False, indent=2)
@@ -0,0 +1,155 @@
+from datetime import datetime
+
+import numpy as np
+
+from parse_dataset_information import date_regex, is_allowed, is_publicly_shareable
+
+"""
+ Checks the rows of the csv before any page is written, and reports all the problems at once
+ (instead of the build crashing on the first bad row, after having written half of the pages).
+
+ What is checked is decided by REQUIRED_COLUMNS and COLUMN_CHECKS. The checks are done one column at a time
+ for a whole batch of rows: every different value of a column is only checked once (most rows have the same
+ share-ability, the same dates...), and the rows are selected with numpy masks.
+ Only the rows that get a page are checked (except for the 'allow' cell), a row that is not allowed yet
+ can be fixed later.
+
+ Usage:
+     csv_validator = CsvValidator()
+     for rows in batches_of_rows:
+         csv_validator.add_rows(rows)
+     csv_validator.raise_if_invalid()
+"""
+
+# the columns that dataset_df_row_to_JSON can't do without
+REQUIRED_COLUMNS = [
+    "allow", "shareability", "dataset_links_from_questionnaire", "data_collection_start", "data_collection_end",
+    "dataset_datatypes", "dataset_lifecycle_stage", "usage_instructions",
+]
+
+# the rows a check is done on
+ALL_ROWS = "all"
+ALLOWED_ROWS = "allowed"  # the ones that get a page
+PUBLIC_ROWS = "public"  # allowed and publicly shareable, their page shows the links
+
+# a long list of problems is not more useful than the first ones
+MAX_REPORTED_PROBLEMS = 200
+
+
+def is_empty_cell(value: str) -> bool:
+    return not value.strip()
+
+
+def is_malformed_date(value: str) -> bool:
+    """ True if date_to_iso can't read the date (an empty date is fine, the page says "Unknown")"""
+    if is_empty_cell(value):
+        return False
+    match = date_regex.match(value)
+    if not match:
+        return True
+    # the same check as the strptime of date_to_iso (like 31/02/2024), but strptime is most of the time of validate
+    try:
+        datetime(int(value[6:]), int(match.group(2)), int(match.group(1)))
+    except ValueError:
+        return True
+    return False
+
+
+# csv column -> [(rows checked, function that is True for a bad value, what is wrong)]
+COLUMN_CHECKS = {
+    "allow": [(ALL_ROWS, is_empty_cell, "the 'allow' cell is empty")],
+    "dataset_title": [(ALLOWED_ROWS, is_empty_cell, "the title is empty")],
+    "shareability": [(ALLOWED_ROWS, is_empty_cell, "the share-ability is empty")],
+    "dataset_links_from_questionnaire": [(PUBLIC_ROWS, is_empty_cell,
+                                          "the data is publicly shareable, but there are no links")],
+    "data_collection_start": [(ALLOWED_ROWS, is_malformed_date,
+                               "the start of data collection is not a dd/mm/yyyy date")],
+    "data_collection_end": [(ALLOWED_ROWS, is_malformed_date, "the end of data collection is not a dd/mm/yyyy date")],
+}
+
+
+class InvalidCsvError(Exception):
+    pass
+
+
+def get_spreadsheet_row_number(index: int) -> int:
+    # the index of iterate_csv_rows starts at 0 after the two rows of the header, the spreadsheet starts at 1
+    return index + 3
+
+
+def number_column_values(rows: list, column_name: str) -> (list, np.ndarray):
+    """ The different values of the column in the (index, row_dict) of rows, and the number of the value of every row"""
+    values = [row[column_name] for _, row in rows]
+    different_values = {value: number for number, value in enumerate(dict.fromkeys(values))}
+    value_numbers = np.fromiter(map(different_values.__getitem__, values), dtype=np.int64, count=len(values))
+    return list(different_values), value_numbers
+
+
+def evaluate_column(numbered_column: (list, np.ndarray), function) -> np.ndarray:
+    """ function(value of the column) for every row of number_column_values, called once for every different value"""
+    different_values, value_numbers = numbered_column
+    results = np.fromiter(map(function, different_values), dtype=bool, count=len(different_values))
+    return results[value_numbers]
+
+
+class CsvValidator:
+    """ Collects the problems of the rows given batch by batch (see the top of this file)"""
+
+    def __init__(self):
+        self.missing_columns = []
+        self.problems = []  # (index of the row, dataset title, what is wrong)
+        self.checked_row_count = 0
+
+    def add_rows(self, rows: list):
+        """ rows is a list of (index, row_dict), like get_database_information_rows gives"""
+        if not rows:
+            return
+        # all the rows of the csv have the same columns
+        column_names = rows[0][1].keys()
+        if self.checked_row_count == 0:
+            self.missing_columns = [column_name for column_name in REQUIRED_COLUMNS if column_name not in column_names]
+        self.checked_row_count += len(rows)
+
+        # every column is numbered once, for all its checks
+        numbered_columns = {column_name: number_column_values(rows, column_name)
+                            for column_name in set(COLUMN_CHECKS) & set(column_names)}
+        no_rows = np.zeros(len(rows), dtype=bool)
+        is_row_allowed = evaluate_column(numbered_columns["allow"], is_allowed) if "allow" in column_names else no_rows
+        is_row_public = evaluate_column(numbered_columns["shareability"], is_publicly_shareable) \
+            if "shareability" in column_names else no_rows
+        checked_rows = {ALL_ROWS: ~no_rows, ALLOWED_ROWS: is_row_allowed, PUBLIC_ROWS: is_row_allowed & is_row_public}
+
+        for column_name, checks in COLUMN_CHECKS.items():
+            if column_name not in column_names:
+                continue
+            for rows_checked, is_bad_value, problem in checks:
+                for position in np.flatnonzero(checked_rows[rows_checked] & evaluate_column(
+                        numbered_columns[column_name], is_bad_value)):
+                    index, row = rows[position]
+                    self.problems.append((index, row.get("dataset_title", ""), problem))
+
+    def is_valid(self) -> bool:
+        return not self.missing_columns and not self.problems
+
+    def get_report(self) -> str:
+        """ The problems, one per line, in the order of the rows"""
+        lines = [f"The csv has no '{column_name}' column" for column_name in self.missing_columns]
+        sorted_problems = sorted(self.problems, key=lambda index_title_and_problem: index_title_and_problem[0])
+        lines += [f"Row {get_spreadsheet_row_number(index)} ('{dataset_title}'): {problem}"
+                  for index, dataset_title, problem in sorted_problems[:MAX_REPORTED_PROBLEMS]]
+        if len(sorted_problems) > MAX_REPORTED_PROBLEMS:
+            lines.append(f"... and {len(sorted_problems) - MAX_REPORTED_PROBLEMS} more problems")
+        return "\n".join(lines)
+
+    def raise_if_invalid(self):
+        if not self.is_valid():
+            problem_count = len(self.missing_columns) + len(self.problems)
+            raise InvalidCsvError(f"Found {problem_count} problems in the {self.checked_row_count} rows of the csv, "
+                                  f"no page was written:\n{self.get_report()}")
+
+
+def validate_rows(rows: list) -> CsvValidator:
+    """ Checks all the rows at once (when they are all in memory anyway)"""
+    csv_validator = CsvValidator()
+    csv_validator.add_rows(rows)
+    return csv_validator
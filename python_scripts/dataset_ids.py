@@ -0,0 +1,161 @@
+import json
+
+from build_manifest import write_text_if_changed
+from paths import DATASET_IDS_FILE
+
+"""
+ The code of a dataset (its page is website_contents/database_webpages/<code>.html) doesn't depend on the position
+ of its row anymore: website_metadata/dataset_ids.json remembers the code of every dataset that was ever built,
+ with what identifies it in the csv (the submission timestamp of the form and the title), and the row it is in now:
+
+     {"version": 1, "next_code": 18,
+      "datasets": {"00001": {"row_index": 0, "submission_timestamp": "13/10/2025 14:41:32", "title": "..."}, ...},
+      "redirects": {"00004": "00017"}}
+
+ A row gets the code of the dataset with the same timestamp and title, or else with the same timestamp
+ (the title was edited). A new row gets the next code, the codes are never given to another dataset.
+ So inserting, deleting or sorting rows doesn't change any page.
+
+ Without dataset_ids.json (the first build), the codes are the row numbers like before, so the urls stay the same.
+ row_index is the index of the row in get_database_information_rows (None for the datasets that were removed).
+
+ When a dataset is removed from the csv but there is still a published dataset with the same title
+ (usually the form was filled again instead of editing the row), its page becomes a redirect to the page of that one.
+ The pages of the other removed datasets are deleted.
+"""
+
+# bump this if the format of the file changes
+DATASET_IDS_VERSION = 1
+
+REDIRECT_PAGE_TEMPLATE = """<!doctype html>
+<html lang="en">
+<head>
+  <meta charset="utf-8">
+  <title>This dataset has moved</title>
+  <meta name="robots" content="noindex">
+  <link rel="canonical" href="{new_code}.html">
+  <meta http-equiv="refresh" content="0; url={new_code}.html">
+</head>
+<body>
+  <p>This dataset has moved to <a href="{new_code}.html">{new_code}.html</a>.</p>
+</body>
+</html>
+"""
+
+
+def format_dataset_code(number: int) -> str:
+    return f"{number:05d}"  # zero padded
+
+
+def make_redirect_page(new_code: str) -> str:
+    return REDIRECT_PAGE_TEMPLATE.format(new_code=new_code)
+
+
+def _get_row_key(row: dict) -> (str, str):
+    return str(row.get("submission_timestamp", "")).strip(), str(row.get("dataset_title", "")).strip()
+
+
+def load_dataset_ids_file():
+    """ The content of dataset_ids.json, or None if there is no usable one"""
+    try:
+        dataset_ids_json = json.loads(DATASET_IDS_FILE.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if dataset_ids_json.get("version") != DATASET_IDS_VERSION:
+        return None
+    return dataset_ids_json
+
+
+class DatasetIds:
+    """
+    Gives a code to every row of the csv (see the top of this file). The rows are given with assign,
+    in the order of the csv, then finish works out the redirects and save writes dataset_ids.json.
+    """
+
+    def __init__(self, dataset_ids_json: dict = None):
+        # without a previous file, the codes are the row numbers
+        self.use_row_numbers = dataset_ids_json is None
+        dataset_ids_json = dataset_ids_json or {"next_code": 1, "datasets": {}}
+        self.next_code = dataset_ids_json["next_code"]
+        self.old_datasets = dataset_ids_json["datasets"]
+
+        # the codes of the datasets of the previous builds, by (timestamp, title) and by timestamp
+        self.codes_by_key = dict()
+        self.codes_by_timestamp = dict()
+        for dataset_code, dataset in self.old_datasets.items():
+            key = (dataset["submission_timestamp"], dataset["title"])
+            self.codes_by_key.setdefault(key, dataset_code)
+            if key[0]:
+                self.codes_by_timestamp.setdefault(key[0], []).append(dataset_code)
+
+        self.datasets = dict()  # the datasets of this build, code -> like in dataset_ids.json
+        self.codes_by_row_index = dict()
+        self.redirects = dict()
+
+    @classmethod
+    def load(cls):
+        return cls(load_dataset_ids_file())
+
+    def _find_old_code(self, submission_timestamp: str, title: str):
+        dataset_code = self.codes_by_key.get((submission_timestamp, title))
+        if dataset_code is not None and dataset_code not in self.datasets:
+            return dataset_code
+        # the title was edited
+        for dataset_code in self.codes_by_timestamp.get(submission_timestamp, []):
+            if dataset_code not in self.datasets:
+                return dataset_code
+        return None
+
+    def assign(self, index: int, row: dict) -> str:
+        """ The code of the row, index is the one of get_database_information_rows"""
+        submission_timestamp, title = _get_row_key(row)
+        if self.use_row_numbers:
+            dataset_code = format_dataset_code(index + 1)
+            self.next_code = max(self.next_code, index + 2)
+        else:
+            dataset_code = self._find_old_code(submission_timestamp, title)
+            if dataset_code is None:
+                dataset_code = format_dataset_code(self.next_code)
+                self.next_code += 1
+
+        self.datasets[dataset_code] = {"row_index": index, "submission_timestamp": submission_timestamp,
+                                       "title": title}
+        self.codes_by_row_index[index] = dataset_code
+        return dataset_code
+
+    def get_code(self, index: int) -> str:
+        """ The code given to the row by assign"""
+        return self.codes_by_row_index[index]
+
+    def finish(self, published_codes: set):
+        """
+        Keeps the datasets that are not in the csv anymore, and redirects them if there is a published one
+        (one that has a page) with the same title.
+        """
+        codes_by_title = dict()
+        for dataset_code, dataset in self.datasets.items():
+            if dataset["title"] and dataset_code in published_codes:
+                codes_by_title.setdefault(dataset["title"].lower(), dataset_code)
+
+        for dataset_code, dataset in self.old_datasets.items():
+            if dataset_code in self.datasets:
+                continue
+            self.datasets[dataset_code] = {**dataset, "row_index": None}
+            new_code = codes_by_title.get(dataset["title"].lower()) if dataset["title"] else None
+            if new_code is not None:
+                self.redirects[dataset_code] = new_code
+
+    def get_removed_codes(self) -> set:
+        """ The datasets that are not in the csv anymore, and have no redirect"""
+        return {dataset_code for dataset_code, dataset in self.datasets.items()
+                if dataset["row_index"] is None and dataset_code not in self.redirects}
+
+    def save(self) -> bool:
+        dataset_ids_json = {
+            "version": DATASET_IDS_VERSION,
+            "next_code": self.next_code,
+            "datasets": self.datasets,
+            "redirects": self.redirects,
+        }
+        return write_text_if_changed(DATASET_IDS_FILE, json.dumps(dataset_ids_json, indent=1, sort_keys=True,
+                                                                  ensure_ascii=False))
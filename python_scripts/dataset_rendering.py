@@ -0,0 +1,200 @@
+import contextlib
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from build_manifest import write_text_if_changed
+from build_stats import logger, add_to_counter, record_row_seconds, take_worker_stats, merge_worker_stats, \
+    add_stage_cpu_seconds, enable_field_timing, is_field_timing_enabled
+from parse_dataset_information import dataset_df_row_to_JSON, compute_derived_columns
+from paths import get_webpage_path
+from render_cache import get_render_cache_folder, set_render_cache_folder
+from webpage_template import CompiledTemplate
+
+"""
+ Turns csv rows into webpages and index entries.
+
+ This is the CPU-heavy part of the generator (markdown, regexes, links...), so it can be spread
+ over several processes with render_datasets(..., jobs=N).
+ The results always come back in the same order as the rows, so the index is the same as in a serial run.
+"""
+
+
+def make_index_entry_from_dataset_variables(dataset_code: str, dataset_variables) -> dict:
+    index_entry = {
+        'id': dataset_code,
+        'allowed_in_database': dataset_variables["allowed?"],
+        'name': dataset_variables["dataset_title"],
+        'keywords': dataset_variables["keywords"],
+        'abstract': dataset_variables["abstract"],
+        'publicly_available': dataset_variables["shareability"] == "Publicly shareable",
+        'author_name': dataset_variables["author_name"],
+        'author_contacts': dataset_variables["author_contacts"],
+        'location': dataset_variables["location"],
+        'collection_start': dataset_variables["collection_start"],
+        'collection_end': dataset_variables["collection_end"],
+        'categories_list': dataset_variables["categories_list"],
+        'research_fields': dataset_variables["research_fields_list"],
+        'data_types': dataset_variables["datatypes_list"],
+        'file_extensions': dataset_variables["file_extensions_list"],
+        'open_for_collaboration': dataset_variables["open_for_collaboration"],
+        'related_datasets': dataset_variables["related_datasets"],
+    }
+    return index_entry
+
+
+def delete_page_if_exists(page_path):
+    try:
+        if page_path.exists():
+            logger.warning("WARNING: Found that the page existed in the past, so it will be deleted.")
+            page_path.unlink()
+            add_to_counter("pages_deleted")
+            logger.debug(f"Deleted old page: {page_path}")
+    except Exception as e:
+        logger.warning(f"WARNING: could not delete {page_path}: {e}")
+
+
+def render_dataset(row, dataset_code: str, template: CompiledTemplate, derived_values: dict = None,
+                   related_datasets: list = None) -> (bool, dict):
+    """
+    Makes the webpage of a single row, and returns (is_allowed, index_entry).
+    If the dataset is not allowed, any old version of its page is deleted and the index entry is None.
+    derived_values can be given if they were already computed with compute_derived_columns.
+    related_datasets is [(code, title)] of the datasets shown in the "Related datasets" section.
+    """
+    # first, we convert the row in a dictionary
+    # but also it has many new attributes added, for our convenience
+    dataset_variables = dataset_df_row_to_JSON(row, dataset_code, derived_values, related_datasets)
+    page_path = get_webpage_path(dataset_code)
+
+    # if a webpage is not allowed, any old version is deleted
+    if not dataset_variables["allowed?"]:
+        logger.debug(f"Removing dataset {dataset_variables['dataset_title']} because it is not allowed.")
+        add_to_counter("datasets_not_allowed")
+        delete_page_if_exists(page_path)
+        return False, None  # avoid making the page and adding an entry to the index
+
+    # fill template, create webpage
+    html_content = template.render(dataset_variables)
+
+    # write file for webpage
+    if write_text_if_changed(page_path, html_content):
+        add_to_counter("pages_written")
+        logger.debug(f"Wrote the page content for dataset {dataset_code} ({dataset_variables['dataset_title']}) to {page_path}")
+    else:
+        add_to_counter("pages_unchanged")
+
+    # make the index entry
+    return True, make_index_entry_from_dataset_variables(dataset_code, dataset_variables)
+
+
+def _get_dataset_title(row) -> str:
+    return str(row.get("dataset_title", ""))
+
+
+class _LogRecordCollector(logging.Handler):
+    """ Keeps the log messages of a worker, so that they can be sent back to the main process"""
+
+    def __init__(self):
+        super().__init__()
+        self.collected_messages = []
+
+    def emit(self, record):
+        self.collected_messages.append((record.levelno, record.getMessage()))
+
+
+# every worker process gets its own copy of the template when it starts
+_worker_template = None
+_worker_log_collector = None
+
+
+def _init_worker(template: CompiledTemplate, render_cache_folder, log_level: int, field_timing_enabled: bool):
+    global _worker_template, _worker_log_collector
+    _worker_template = template
+    set_render_cache_folder(render_cache_folder)
+    enable_field_timing(field_timing_enabled)
+
+    # the messages are not shown by the worker, but sent back
+    _worker_log_collector = _LogRecordCollector()
+    logger.handlers = [_worker_log_collector]
+    logger.propagate = False
+    logger.setLevel(log_level)
+
+
+def _render_dataset_in_worker(code_row_derived_values_and_related_datasets):
+    """ Same as render_dataset, but the log messages and the stats are sent back,
+    so that the main process can show them in row order"""
+    dataset_code, row, derived_values, related_datasets = code_row_derived_values_and_related_datasets
+    _worker_log_collector.collected_messages = []
+    start_wall_time, start_cpu_time = time.perf_counter(), time.process_time()
+
+    is_allowed, index_entry = render_dataset(row, dataset_code, _worker_template, derived_values, related_datasets)
+
+    row_seconds = time.perf_counter() - start_wall_time
+    row_cpu_seconds = time.process_time() - start_cpu_time
+    return (is_allowed, index_entry, _worker_log_collector.collected_messages, row_seconds, row_cpu_seconds,
+            take_worker_stats())
+
+
+def resolve_jobs(jobs: int) -> int:
+    """ 0 means one process per CPU"""
+    return (os.cpu_count() or 1) if jobs == 0 else jobs
+
+
+@contextlib.contextmanager
+def open_render_executor(template: CompiledTemplate, jobs: int = 1):
+    """
+    The pool of processes used by render_datasets, or None with a single job.
+    Opening it once and passing it to every call of render_datasets avoids starting new processes for every batch.
+    """
+    jobs = resolve_jobs(jobs)
+    if jobs <= 1:
+        yield None
+        return
+
+    worker_settings = (template, get_render_cache_folder(), logger.getEffectiveLevel(), is_field_timing_enabled())
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=worker_settings) as executor:
+        yield executor
+
+
+def render_datasets(codes_and_rows: list, template: CompiledTemplate, jobs: int = 1, executor=None,
+                    related_datasets: dict = None):
+    """
+    Renders every (dataset_code, row) and yields (dataset_code, is_allowed, index_entry), in the same order.
+    With jobs > 1 the rows are sent in chunks to a pool of processes (the one of open_render_executor if given).
+    related_datasets is {dataset_code: [(code, title)]} (see related_datasets.py), none are shown if it's not given.
+    """
+    jobs = resolve_jobs(jobs)
+    if jobs > 1 and executor is None and len(codes_and_rows) >= 2:
+        with open_render_executor(template, jobs) as executor:
+            yield from render_datasets(codes_and_rows, template, jobs, executor, related_datasets)
+        return
+
+    # the attributes that only depend on one column are computed for all rows at once, in this process
+    all_derived_values = compute_derived_columns([row for _, row in codes_and_rows])
+    related_datasets = related_datasets or dict()
+    rendering_arguments = [(dataset_code, row, derived_values, related_datasets.get(dataset_code))
+                           for (dataset_code, row), derived_values in zip(codes_and_rows, all_derived_values)]
+
+    if executor is None or len(codes_and_rows) < 2:
+        for dataset_code, row, derived_values, dataset_related_datasets in rendering_arguments:
+            start_time = time.perf_counter()
+            is_allowed, index_entry = render_dataset(row, dataset_code, template, derived_values,
+                                                     dataset_related_datasets)
+            record_row_seconds(dataset_code, _get_dataset_title(row), time.perf_counter() - start_time)
+            yield dataset_code, is_allowed, index_entry
+        return
+
+    # a few chunks per worker, so that a slow chunk doesn't leave the other workers idle at the end
+    chunk_size = max(1, len(codes_and_rows) // (jobs * 4))
+    worker_results = executor.map(_render_dataset_in_worker, rendering_arguments, chunksize=chunk_size)
+    # executor.map gives back the results in the order of the input
+    for (dataset_code, row), worker_result in zip(codes_and_rows, worker_results):
+        is_allowed, index_entry, log_messages, row_seconds, row_cpu_seconds, worker_stats = worker_result
+        for log_level, message in log_messages:
+            logger.log(log_level, message)
+        record_row_seconds(dataset_code, _get_dataset_title(row), row_seconds)
+        add_stage_cpu_seconds("render_workers", row_cpu_seconds)
+        merge_worker_stats(worker_stats)
+        yield dataset_code, is_allowed, index_entry
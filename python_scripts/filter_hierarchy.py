@@ -0,0 +1,80 @@
+"""
+ The hierarchies of filter_options.json (England is in UK, UK is in Europe...), compiled into bitmasks.
+
+ Every option of a filter gets a bit, in the order of the file (parents before children).
+ A set of options is then an int with those bits set, and for every option we keep the mask of its ancestors,
+ so adding the missing supercategories of a dataset, or counting the datasets under an option,
+ are a few ORs and ANDs instead of unions of sets of strings.
+ Python ints have no size limit, so this works the same with thousands of options.
+"""
+
+
+def iterate_bits(mask: int):
+    """ The positions of the bits that are set in mask, from the lowest"""
+    while mask:
+        lowest_bit = mask & -mask
+        yield lowest_bit.bit_length() - 1
+        mask ^= lowest_bit
+
+
+class FilterHierarchy:
+    def __init__(self, filter_options: dict):
+        """
+        filter_options is one of the trees of filter_options.json, like {'A': {'B': {}, 'C': {}}, 'D': {}}.
+        An option that appears in several places (Cyprus is in Europe and in the Middle East) has one bit,
+        and the ancestors of all the places.
+        """
+        self.option_names = []  # bit -> option
+        self.option_depths = []  # bit -> depth in the tree, 0 for the top-level options
+        self.bits = dict()  # option -> bit
+        self.lowercase_bits = dict()  # lowercase option -> bit, the search is not case sensitive
+        self.ancestor_masks = []  # bit -> mask of the ancestors of the option
+
+        def visit_tree(tree: dict, ancestors_mask: int, depth: int):
+            for option_name, sub_options in tree.items():
+                bit = self.bits.get(option_name)
+                if bit is None:
+                    bit = len(self.option_names)
+                    self.bits[option_name] = bit
+                    self.lowercase_bits.setdefault(option_name.lower(), bit)
+                    self.option_names.append(option_name)
+                    self.option_depths.append(depth)
+                    self.ancestor_masks.append(0)
+                self.ancestor_masks[bit] |= ancestors_mask
+                visit_tree(sub_options, ancestors_mask | (1 << bit), depth + 1)
+
+        visit_tree(filter_options, 0, 0)
+
+    def mask_of(self, option_names, ignore_case: bool = False) -> int:
+        """ The mask of the options in option_names, the ones that are not in the hierarchy are ignored"""
+        bits = self.lowercase_bits if ignore_case else self.bits
+        mask = 0
+        for option_name in option_names:
+            bit = bits.get(option_name.lower() if ignore_case else option_name)
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def names_of(self, mask: int) -> list[str]:
+        """ The options in mask, in the order of filter_options.json"""
+        return [self.option_names[bit] for bit in iterate_bits(mask)]
+
+    def ancestors_of(self, mask: int) -> int:
+        """ The mask of all the ancestors of the options in mask"""
+        ancestors_mask = 0
+        for bit in iterate_bits(mask):
+            ancestors_mask |= self.ancestor_masks[bit]
+        return ancestors_mask
+
+    def count_per_option(self, mask_counts: dict) -> list[int]:
+        """
+        mask_counts is {mask: number of datasets with exactly these options}.
+        Returns, for every option (by bit), the number of datasets that have it or one of its descendants,
+        so a dataset in England is also counted in UK and Europe.
+        """
+        # many datasets have the same options, so every different mask is only looked at once
+        counts = [0] * len(self.option_names)
+        for mask, mask_count in mask_counts.items():
+            for bit in iterate_bits(mask | self.ancestors_of(mask)):
+                counts[bit] += mask_count
+        return counts
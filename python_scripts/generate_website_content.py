@@ -3,138 +3,374 @@
 generate_webpages.py
 
 Reads `database_information.csv` and generates:
- - a folder `database_webpages/` with a simple HTML page per row (identified by a zero-padded row index)
- - `database_index.json` used by the client search
+ - a folder `database_webpages/` with a simple HTML page per row, identified by a zero-padded code that stays the same
+        when rows are moved (the codes are kept in `dataset_ids.json`, see dataset_ids.py)
+ - `database_index.json`, with all the information of every dataset
+ - `database_listing.json` and `index_shards/`, the same information split in what the website needs first
+        and what it can load later (see index_output.py)
+ - `search_index.json`, the postings of the words and filter values, so the client search doesn't scan every dataset
+ - `facet_counts.json`, the number of datasets for every option of the filters
+ - the "Related datasets" of every page, also in the index (see related_datasets.py)
+ - copies of the index and metadata files with the hash of their content in the name,
+        listed in `asset_manifest.json`, so that browsers can cache them (see asset_manifest.py)
  - updates the content of website_metadata/website_generation_metadata.json,
-        which just contains the timestamp of the last edit
+        which just contains the timestamp of the last build that changed something
 
 Usage:
  It is supposed to be executed by a GitHub action, but you can run it locally too.
  It just looks for that csv, and creates new files.
- You might need to install pandas and markdown.
+ The csv is read twice: first to check every row and find the related datasets (which need all the rows),
+ then to render it ROWS_PER_BATCH rows at a time, with the index entries streamed to the outputs:
+ the rows, pages and index entries of a batch are dropped before the next one.
+ What is kept for the whole build still grows with the number of rows: the codes (dataset_ids.py), the related
+ datasets, the listing, the postings of the search index and the build manifest, around 4KB per row.
+ benchmarks/benchmark_pipeline.py measures the peak memory: about 60MB for 1k rows, 100MB for 10k, 450MB for 100k.
+ If some rows are not valid, all their problems are reported after the first read and nothing is written
+ (see csv_validation.py).
+ You might need to install markdown and numpy (brotli for the .br copies of the metadata files,
+ pandas is only needed to use get_database_information_df).
+
+ With --incremental, only the rows that changed since the last build are re-rendered
+ (the hashes of the rows are kept in website_metadata/build_manifest.json).
+ With --jobs N, the rows are rendered by N processes.
+ The rendered markdown is cached in .cache/render_cache (see render_cache.py), --no-render-cache disables it.
+ --quiet hides the messages about every single dataset.
+ --profile prints how long every stage took (and --stats-json PATH writes it to a file, see build_stats.py),
+ --cprofile PATH saves the output of cProfile for the main process.
+ With --watch, after the build the script keeps running and rebuilds (incrementally) every time the csv,
+ the template or filter_options.json change, for previewing edits quickly (see watch_mode.py).
 
 The script is robust to slightly different header punctuation/casing
     by normalising column names.
 """
 
+import argparse
+import cProfile
+import itertools
 import json
 
 import datetime
 
-from parse_dataset_information import dataset_df_row_to_JSON
-from paths import WEBPAGES_FOLDER, INDEX_PATH, TEMPLATE_FILE, get_webpage_path, GENERATION_METADATA_FILE
-from read_csv_safely import get_database_information_df, check_database_allow_column_is_valid
-
-try:
-    import pandas as pd
-    import markdown
-except Exception as e:
-    raise SystemExit("pandas and markdown are required. In theory, github actions should do that?")
-
-# Output directory
-WEBPAGES_FOLDER.mkdir(parents=True, exist_ok=True)
-
-index_list = []
-
-
-# safe fill_in_gaps function
-
-def fill_in_gaps(template_str: str, variables_dict: dict) -> str:
+from asset_manifest import write_fingerprinted_copies
+from build_manifest import compute_build_fingerprint, compute_row_hash, load_build_manifest, save_build_manifest, \
+    write_text_if_changed
+from build_stats import logger, configure_logging, enable_field_timing, timed_stage, add_to_counter, get_counter, \
+    log_build_stats, write_build_stats
+from csv_validation import CsvValidator, InvalidCsvError
+from dataset_ids import DatasetIds, make_redirect_page
+from dataset_rendering import render_datasets, delete_page_if_exists, open_render_executor
+from index_output import SplitIndexWriter, JsonArrayFileWriter, write_json_output, iterate_json_array
+from parse_dataset_information import DERIVED_DATASET_VARIABLE_NAMES, load_filter_options
+from paths import WEBPAGES_FOLDER, INDEX_PATH, TEMPLATE_FILE, get_webpage_path, GENERATION_METADATA_FILE, \
+    SEARCH_INDEX_PATH, LISTING_INDEX_PATH, INDEX_SHARDS_FOLDER, FACET_COUNTS_PATH, CSV_PATH, FILTER_OPTIONS_FILE
+from read_csv_safely import get_database_information_rows
+from related_datasets import RelatedDatasetsFinder
+from render_cache import set_render_cache_folder, prune_render_cache
+from search_index import SearchIndexBuilder, FacetCounter
+from watch_mode import watch_and_rebuild
+from webpage_template import CompiledTemplate
+
+# the csv is processed this many rows at a time, only the pages and index entries of one batch are in memory
+ROWS_PER_BATCH = 1000
+
+
+def report_template_placeholders(template: CompiledTemplate, known_variable_names: set):
+    unknown_placeholders, unused_variables = template.find_unknown_and_unused_placeholders(known_variable_names)
+    for placeholder_name in sorted(unknown_placeholders):
+        logger.warning(f"WARNING: the template contains {{{placeholder_name}}}, but no dataset has that attribute.")
+    if unused_variables:
+        logger.info(f"The template does not use {len(unused_variables)} dataset attributes: {', '.join(sorted(map(str, unused_variables)))}")
+
+
+class PreviousIndex:
     """
-    This function takes a string such as "my name is {name}" and will fill in the
-    items in the {}s as long as they are in variables_dict.
-
-    This is used to make the webpages
+    The entries of the index written by the previous build, read one at a time (see iterate_json_array).
+    The datasets are usually looked up in the order of the index (the order of the rows), so the whole old index
+    is not in memory. The entries that are skipped to find a dataset are kept until they are looked up
+    (after rows were moved).
     """
-    result = template_str
-    for key, value in variables_dict.items():
-        # Replace all occurrences of {key} with its value converted to string
-        if not isinstance(value, str):
-            continue
-        placeholder = "{" + key + "}"
-        result = result.replace(placeholder, str(value))
-    return result
-
-
-def make_index_entry_from_dataset_variables(dataset_code: str, dataset_variables) -> dict:
-    index_entry = {
-        'id': dataset_code,
-        'allowed_in_database': dataset_variables["allowed?"],
-        'name': dataset_variables["dataset_title"],
-        'keywords': dataset_variables["keywords"],
-        'abstract': dataset_variables["abstract"],
-        'publicly_available': dataset_variables["shareability"] == "Publicly shareable",
-        'author_name': dataset_variables["author_name"],
-        'author_contacts': dataset_variables["author_contacts"],
-        'location': dataset_variables["location"],
-        'collection_start': dataset_variables["collection_start"],
-        'collection_end': dataset_variables["collection_end"],
-        'categories_list': dataset_variables["categories_list"],
-        'research_fields': dataset_variables["research_fields_list"],
-        'data_types': dataset_variables["datatypes_list"],
-        'file_extensions': dataset_variables["file_extensions_list"],
-        'open_for_collaboration': dataset_variables["open_for_collaboration"]
-    }
-    return index_entry
-
-
-# read template
-with open(TEMPLATE_FILE, "r", encoding="utf-8") as file:
-    template_string = file.read()
-
-# reads the database_information.csv file safely (with checks, and renaming columns)
-df = get_database_information_df()
-
-is_dataframe_valid, error_message = check_database_allow_column_is_valid(df)
-if not is_dataframe_valid:
-    raise Exception(error_message)
-
-
-# convert each row of the csv into two things:
-#   a webpage
-#   a little json which will be loaded by the website to search through datasets
-
-for index, row in df.iterrows():
-    dataset_code = f"{index + 1:05d}"  # 1-based, zero padded
-
-    # first, we convert the row in a dictionary
-    # but also it has many new attributes added, for our convenience
-    dataset_variables = dataset_df_row_to_JSON(row, dataset_code)
-    page_path = get_webpage_path(dataset_code)
-
-    # if a webpage is not allowed, any old version is deleted
-    if not dataset_variables["allowed?"]:
-        print(f"Removing dataset {dataset_variables['dataset_title']} because it is not allowed.")
 
-        try:
-            if page_path.exists():
-                print("WARNING: Found that the page existed in the past, so it will be deleted.")
-                page_path.unlink()
-                print(f"Deleted old page: {page_path}")
-        except Exception as e:
-            print(f"WARNING: could not delete {page_path}: {e}")
+    def __init__(self):
+        self.entries = iterate_json_array(INDEX_PATH)
+        self.skipped_entries = dict()
 
-        continue  # avoid making the page and adding an entry to the index
+    def _read_next_entry(self):
+        try:
+            return next(self.entries)
+        except (StopIteration, OSError, ValueError):
+            # no index yet, or a broken one: the datasets will just be rendered again
+            return None
 
-    # fill template, create webpage
-    html_content = fill_in_gaps(template_string, dataset_variables)
+    def get(self, dataset_code: str):
+        """ Only called for the datasets that are in the old index (they were allowed in the previous build)"""
+        if dataset_code in self.skipped_entries:
+            return self.skipped_entries.pop(dataset_code)
+        while (entry := self._read_next_entry()) is not None:
+            if entry["id"] == dataset_code:
+                return entry
+            self.skipped_entries[entry["id"]] = entry
+        return None
 
-    # write file for webpage
-    page_path.write_text(html_content, encoding='utf-8')
-    print(f"Wrote the page content for dataset {dataset_code} ({dataset_variables['dataset_title']}) to {page_path}")
+    def close(self):
+        self.entries.close()
 
-    # make the index entry
-    index_entry = make_index_entry_from_dataset_variables(dataset_code, dataset_variables)
 
-    index_list.append(index_entry)
+def iterate_batches(items, batch_size: int):
+    iterator = iter(items)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield batch
 
-# Write JSON index
-INDEX_PATH.write_text(json.dumps(index_list, ensure_ascii=False, indent=2), encoding='utf-8')
-print(f"Generated {len(index_list)} pages in '{WEBPAGES_FOLDER}' and index at '{INDEX_PATH}'")
 
-# Write the current timestamp on the website_generation_metadata.json
-current_time_as_string = str(datetime.datetime.now())
-metadata_json = dict()
-metadata_json["last_updated"] = current_time_as_string
-with open(GENERATION_METADATA_FILE, "w") as file:
-    json.dump(obj=metadata_json, fp=file)
+def check_rows_and_find_related_datasets(template: CompiledTemplate, dataset_ids: DatasetIds) -> dict:
+    """
+    First pass over the csv: checks every row (before any page is written, see csv_validation.py),
+    gives a code to every row (see dataset_ids.py),
+    and returns the related datasets of every dataset (see related_datasets.py).
+    Raises an InvalidCsvError with all the problems of the csv if some rows are not valid.
+    """
+    csv_validator = CsvValidator()
+    related_datasets_finder = RelatedDatasetsFinder()
+    checked_template_placeholders = False
+
+    row_batches = iterate_batches(get_database_information_rows(), ROWS_PER_BATCH)
+    while True:
+        with timed_stage("read_csv"):
+            rows = next(row_batches, None)
+        if rows is None:
+            break
+
+        with timed_stage("validate"):
+            csv_validator.add_rows(rows)
+
+            if not checked_template_placeholders:
+                report_template_placeholders(template, set(rows[0][1].keys()) | DERIVED_DATASET_VARIABLE_NAMES)
+                checked_template_placeholders = True
+
+        # the build is going to fail anyway, the rest of the csv is only checked
+        if not csv_validator.is_valid():
+            continue
+        with timed_stage("dataset_ids"):
+            codes_and_rows = [(dataset_ids.assign(index, row), row) for index, row in rows]
+        with timed_stage("related_datasets"):
+            related_datasets_finder.add_rows(codes_and_rows)
+
+    if not checked_template_placeholders:
+        report_template_placeholders(template, DERIVED_DATASET_VARIABLE_NAMES)
+    csv_validator.raise_if_invalid()
+
+    with timed_stage("related_datasets"):
+        return related_datasets_finder.build()
+
+
+def main(incremental: bool = False, jobs: int = 1, use_render_cache: bool = True):
+    if not use_render_cache:
+        set_render_cache_folder(None)
+
+    # to know if this build changed anything (the counters add up over the builds of --watch)
+    bytes_written_before, pages_deleted_before = get_counter("bytes_written"), get_counter("pages_deleted")
+
+    # Output directory
+    WEBPAGES_FOLDER.mkdir(parents=True, exist_ok=True)
+
+    # read template
+    with open(TEMPLATE_FILE, "r", encoding="utf-8") as file:
+        template = CompiledTemplate(file.read())
+
+    # the manifest of the previous build is always loaded, so that pages of removed rows can be deleted.
+    # Unchanged rows are only skipped in incremental mode
+    old_manifest = load_build_manifest()
+    previous_index = PreviousIndex() if incremental else None
+    build_fingerprint = compute_build_fingerprint()
+    new_manifest = dict()
+    skipped_count = 0
+
+    dataset_ids = DatasetIds.load()
+    related_datasets = check_rows_and_find_related_datasets(template, dataset_ids)
+
+    # every index entry is given to all the outputs as soon as it is made, so they are never all in memory
+    # (the outputs only keep what they need: the listing entries, the postings and the facet counts)
+    index_writer = JsonArrayFileWriter(INDEX_PATH)
+    split_index_writer = SplitIndexWriter()
+    search_index_builder = SearchIndexBuilder()
+    facet_counter = FacetCounter()
+    index_outputs = [("write_index", index_writer), ("write_split_index", split_index_writer),
+                     ("write_search_index", search_index_builder), ("write_facet_counts", facet_counter)]
+
+    # the csv is read and rendered ROWS_PER_BATCH rows at a time
+    row_batches = iterate_batches(get_database_information_rows(), ROWS_PER_BATCH)
+    with open_render_executor(template, jobs) as executor:
+        while True:
+            # reads the database_information.csv file safely (with checks, and renaming columns)
+            with timed_stage("read_csv"):
+                rows = next(row_batches, None)
+            if rows is None:
+                break
+
+            with timed_stage("compare_manifest"):
+                # the index entries of the datasets are collected by code, and put back in row order at the end
+                dataset_codes_in_row_order = []
+                index_entries = dict()
+                codes_and_rows_to_render = []
+
+                for index, row in rows:
+                    dataset_code = dataset_ids.get_code(index)
+                    dataset_codes_in_row_order.append(dataset_code)
+
+                    row_hash = compute_row_hash(row, build_fingerprint, related_datasets.get(dataset_code))
+                    old_manifest_entry = old_manifest.get(dataset_code)
+                    if incremental and old_manifest_entry is not None and old_manifest_entry["hash"] == row_hash:
+                        # nothing changed, reuse what the previous build made
+                        if not old_manifest_entry["allowed"]:
+                            new_manifest[dataset_code] = old_manifest_entry
+                            skipped_count += 1
+                            continue
+                        previous_index_entry = previous_index.get(dataset_code)
+                        if previous_index_entry is not None and get_webpage_path(dataset_code).exists():
+                            new_manifest[dataset_code] = old_manifest_entry
+                            index_entries[dataset_code] = previous_index_entry
+                            skipped_count += 1
+                            continue
+
+                    new_manifest[dataset_code] = {"hash": row_hash}
+                    codes_and_rows_to_render.append((dataset_code, row))
+
+            # convert each row of the csv into two things:
+            #   a webpage
+            #   a little json which will be loaded by the website to search through datasets
+            # (see dataset_rendering.py, this can be done in parallel with --jobs)
+            with timed_stage("render_datasets"):
+                for dataset_code, is_allowed, index_entry in render_datasets(codes_and_rows_to_render, template,
+                                                                             jobs, executor, related_datasets):
+                    new_manifest[dataset_code]["allowed"] = is_allowed
+                    if is_allowed:
+                        index_entries[dataset_code] = index_entry
+
+            batch_index_list = [index_entries[dataset_code] for dataset_code in dataset_codes_in_row_order
+                                if dataset_code in index_entries]
+            for stage_name, index_output in index_outputs:
+                with timed_stage(stage_name):
+                    for index_entry in batch_index_list:
+                        index_output.add(index_entry)
+
+    if previous_index is not None:
+        previous_index.close()
+
+    # rows that were in the previous build, but are not in the csv anymore: their page is deleted,
+    # or becomes a redirect if a dataset with the same title is still there (see dataset_ids.py)
+    with timed_stage("delete_removed"):
+        dataset_ids.finish({dataset_code for dataset_code, manifest_entry in new_manifest.items()
+                            if manifest_entry["allowed"]})
+        for old_dataset_code, new_dataset_code in dataset_ids.redirects.items():
+            if write_text_if_changed(get_webpage_path(old_dataset_code), make_redirect_page(new_dataset_code)):
+                logger.info(f"Dataset {old_dataset_code} is not in the csv anymore, its page redirects to {new_dataset_code}.")
+        removed_dataset_codes = dataset_ids.get_removed_codes() | \
+            (old_manifest.keys() - new_manifest.keys() - dataset_ids.redirects.keys())
+        for removed_dataset_code in sorted(removed_dataset_codes):
+            logger.debug(f"Removing dataset {removed_dataset_code} because it is not in the csv anymore.")
+            delete_page_if_exists(get_webpage_path(removed_dataset_code))
+
+    add_to_counter("pages_skipped", skipped_count)
+    if skipped_count:
+        logger.info(f"Skipped {skipped_count} datasets that did not change since the last build.")
+
+    # Write JSON index
+    with timed_stage("write_index"):
+        index_writer.close()
+    logger.info(f"Generated {index_writer.item_count} pages in '{WEBPAGES_FOLDER}' and index at '{INDEX_PATH}'")
+
+    # Write the listing and the shards that the website actually loads (see index_output.py)
+    with timed_stage("write_split_index"):
+        split_index_writer.finish()
+    logger.info(f"Generated the listing at '{LISTING_INDEX_PATH}' and its shards in '{INDEX_SHARDS_FOLDER}'")
+
+    # Write the prebuilt search index (token and filter postings, see search_index.py)
+    with timed_stage("write_search_index"):
+        write_json_output(SEARCH_INDEX_PATH, search_index_builder.build())
+    logger.info(f"Generated the search index at '{SEARCH_INDEX_PATH}'")
+
+    with timed_stage("write_facet_counts"):
+        write_json_output(FACET_COUNTS_PATH, facet_counter.build())
+    logger.info(f"Generated the facet counts at '{FACET_COUNTS_PATH}'")
+
+    with timed_stage("save_manifest"):
+        save_build_manifest(new_manifest)
+        dataset_ids.save()
+
+    with timed_stage("prune_render_cache"):
+        evicted_count = prune_render_cache()
+    if evicted_count:
+        logger.info(f"Removed {evicted_count} old entries from the render cache.")
+
+    # the copies of the index and metadata files with the hash of their content in the name (see asset_manifest.py)
+    with timed_stage("write_fingerprinted_copies"):
+        metadata_changed = write_fingerprinted_copies()
+
+    # Write the current timestamp on the website_generation_metadata.json, only if something changed
+    content_changed = metadata_changed or get_counter("bytes_written") > bytes_written_before \
+        or get_counter("pages_deleted") > pages_deleted_before
+    if content_changed or not GENERATION_METADATA_FILE.exists():
+        current_time_as_string = str(datetime.datetime.now())
+        metadata_json = dict()
+        metadata_json["last_updated"] = current_time_as_string
+        with open(GENERATION_METADATA_FILE, "w") as file:
+            json.dump(obj=metadata_json, fp=file)
+    else:
+        logger.info("Nothing changed since the last build, the timestamp of the website is the same.")
+
+
+def watch(jobs: int = 1, use_render_cache: bool = True):
+    """ Rebuilds every time an input changes. Only the rows that changed are rendered again (like --incremental)"""
+
+    def rebuild(changed_paths):
+        if FILTER_OPTIONS_FILE in changed_paths:
+            load_filter_options()
+        main(incremental=True, jobs=jobs, use_render_cache=use_render_cache)
+
+    watch_and_rebuild([CSV_PATH, TEMPLATE_FILE, FILTER_OPTIONS_FILE], rebuild)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates the dataset webpages and the search index from the csv.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only re-render the datasets that changed since the last build (see build_manifest.py)")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of processes used to render the datasets (0 means one per CPU)")
+    parser.add_argument("--no-render-cache", action="store_true",
+                        help="always render the markdown again, instead of using the cache in .cache/render_cache")
+    parser.add_argument("--quiet", action="store_true",
+                        help="don't show a message for every dataset, only the summaries and the warnings")
+    parser.add_argument("--profile", action="store_true",
+                        help="show how long every stage took, and the slowest fields and rows")
+    parser.add_argument("--stats-json", metavar="PATH",
+                        help="write the times of the stages, fields and rows to a json file")
+    parser.add_argument("--cprofile", metavar="PATH",
+                        help="save the cProfile stats of the main process (open them with pstats or snakeviz)")
+    parser.add_argument("--watch", action="store_true",
+                        help="after the build, keep rebuilding every time the csv, the template or the filter options change")
+    args = parser.parse_args()
+
+    configure_logging(quiet=args.quiet)
+    enable_field_timing(args.profile or args.stats_json is not None)
+
+    profiler = cProfile.Profile() if args.cprofile else None
+    if profiler:
+        profiler.enable()
+
+    try:
+        main(incremental=args.incremental, jobs=args.jobs, use_render_cache=not args.no_render_cache)
+    except InvalidCsvError as e:
+        # the report is enough, the traceback would only hide it
+        raise SystemExit(str(e))
+
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.cprofile)
+        logger.info(f"Saved the cProfile stats to {args.cprofile}")
+    if args.profile:
+        log_build_stats()
+    if args.stats_json:
+        write_build_stats(args.stats_json)
+        logger.info(f"Saved the build stats to {args.stats_json}")
+
+    if args.watch:
+        watch(jobs=args.jobs, use_render_cache=not args.no_render_cache)
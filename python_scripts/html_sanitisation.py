@@ -0,0 +1,106 @@
+import re
+
+from build_stats import timed_field
+
+"""
+ The last stage of dataset_df_row_to_JSON: the dangerous HTML tags are removed from every text attribute
+ of a dataset, and the urls of some attributes become links.
+
+ How every attribute is handled is decided by FIELD_HANDLING (MARKUP for the ones that are not in it,
+ like the csv columns), so that:
+     * the attributes that went through html.escape are not looked at, they can't contain tags anymore
+     * the attributes that don't contain a "<" are not looked at either, which is most of them
+     * the tag regex only runs on a linkified attribute if its text had a "<" before the links were added
+ The linkification and the tag removal are timed separately (timed_field "linkification" and "sanitisation").
+ sanitise_dataset_variables returns how many tags were removed from every attribute.
+"""
+
+# precompiled regex to remove dangerous tags and their contents (case-insensitive)
+DANGEROUS_TAGS_RE = re.compile(r"(?is)</?(script|iframe|object|embed|style|form|svg)[^>]*>")
+
+# Regex to match URLs, with optional protocol
+url_pattern = re.compile(
+    r'(?:(?:https?://)?(?:www\.)?[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})(?:/[^\s]*)?'
+)
+
+
+def remove_dangerous_tags(original_str: str) -> str:
+    # takes a string that will be pasted into the HTML, and removes tags that are dangerous
+    # the markdown should produce h3, table, thead, tr, th, tf, tbody, em, strong, a, img, old, li
+
+    return DANGEROUS_TAGS_RE.sub("", original_str)
+
+
+def remove_dangerous_tags_and_count(original_str: str) -> (str, int):
+    """ Same as remove_dangerous_tags, but also returns the number of tags that were removed"""
+    if "<" not in original_str:
+        # no tags at all, which is the case of most attributes
+        return original_str, 0
+    return DANGEROUS_TAGS_RE.subn("", original_str)
+
+
+def _replace_link(match):
+    url = match.group(0)
+    href = url if url.startswith(('http://', 'https://')) else 'https://' + url
+    return f'<a href="{href}" target="_blank">{url}</a>'
+
+
+def convert_str_in_HTML_with_clickable_links(input_str: str):
+    """
+    Convert all URLs in a string into HTML <a> links.
+    Accepts links with or without http(s)://.
+    Might get confused with emails
+    """
+    return url_pattern.sub(_replace_link, input_str)
+
+
+ESCAPED = "escaped"  # went through html.escape, so it can't contain tags
+MARKUP = "markup"  # can contain HTML (from the csv, or made from it): the dangerous tags are removed
+LINKIFIED = "linkified"  # text from the csv where the urls become links, then like MARKUP
+SANITISED = "sanitised"  # already sanitised when it was made (the description, see render_description_markdown)
+
+# attribute of dataset_df_row_to_JSON -> how it is handled, MARKUP if it is not here
+FIELD_HANDLING = {
+    "dataset_title": ESCAPED,
+    "abstract": ESCAPED,
+    "abstract_escaped_for_schema": ESCAPED,
+    "keywords_html": ESCAPED,
+    "keywords_schema": ESCAPED,
+    "related_datasets_html": ESCAPED,  # links made from the escaped titles of other datasets
+    "data_collection_methodology": LINKIFIED,
+    "description": SANITISED,
+}
+
+LINKIFIED_FIELDS = [key for key, field_handling in FIELD_HANDLING.items() if field_handling == LINKIFIED]
+
+
+def sanitise_dataset_variables(dataset_variables: dict) -> dict:
+    """
+    Removes the dangerous tags from the text attributes of dataset_variables (in place),
+    and turns the urls of the LINKIFIED attributes into links.
+    Returns {attribute: number of tags removed}, only for the attributes where something was removed.
+    """
+    # the links that were added can only contain a dangerous tag if the text already had a "<"
+    keys_without_tags = set()
+    with timed_field("linkification"):
+        for key in LINKIFIED_FIELDS:
+            value = dataset_variables.get(key)
+            if isinstance(value, str):
+                dataset_variables[key] = convert_str_in_HTML_with_clickable_links(value)
+                if "<" not in value:
+                    keys_without_tags.add(key)
+
+    removed_tag_counts = dict()
+    with timed_field("sanitisation"):
+        for key, value in dataset_variables.items():
+            if not isinstance(value, str) or key in keys_without_tags:
+                continue
+            field_handling = FIELD_HANDLING.get(key, MARKUP)
+            if field_handling == ESCAPED or field_handling == SANITISED:
+                continue
+
+            new_value, removed_tag_count = remove_dangerous_tags_and_count(value)
+            dataset_variables[key] = new_value
+            if removed_tag_count:
+                removed_tag_counts[key] = removed_tag_count
+    return removed_tag_counts
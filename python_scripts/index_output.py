@@ -0,0 +1,216 @@
+import gzip
+import hashlib
+import json
+
+from build_manifest import write_bytes_if_changed, replace_file_if_changed
+from paths import LISTING_INDEX_PATH, INDEX_SHARDS_FOLDER, INDEX_MANIFEST_PATH
+
+try:
+    import brotli
+except ImportError:
+    brotli = None  # the .br files are only made if brotli is installed
+
+"""
+ The index that the website loads, split so that the first paint doesn't wait for every abstract:
+     * database_listing.json: one small entry per allowed dataset, with short keys (see LISTING_KEYS).
+       This is enough for the dataset listing, and to filter the search results.
+     * index_shards/shard_NNN.json: the other attributes of the datasets ({id: details}),
+       fetched only when they are needed. The listing entry says in which shard a dataset is ("h").
+     * index_manifest.json: the size and hash of all these files.
+
+ Every file is written as compact json, together with a .gz (and a .br if brotli is installed) copy.
+
+ The generator gives the entries one at a time (SplitIndexWriter.add), so only the listing and the current shard
+ are in memory. database_index.json is streamed the same way (JsonArrayFileWriter), and read back
+ one entry at a time by the next incremental build (iterate_json_array).
+"""
+
+# attribute of the index entry -> key in database_listing.json
+LISTING_KEYS = {
+    "id": "i",
+    "name": "n",
+    "publicly_available": "p",
+    "open_for_collaboration": "c",
+    "collection_start": "s",
+    "collection_end": "e",
+}
+SHARD_KEY = "h"
+
+DATASETS_PER_SHARD = 500
+
+
+def get_shard_path(shard_number: int):
+    return INDEX_SHARDS_FOLDER / f"shard_{shard_number:03d}.json"
+
+
+def to_compact_json(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def get_manifest_entry(path, content: bytes) -> dict:
+    """ The entry of a file in index_manifest.json"""
+    return {
+        "path": path.as_posix(),
+        "size": len(content),
+        "sha256": hashlib.sha256(content).hexdigest(),
+    }
+
+
+def write_json_output(path, obj) -> dict:
+    """
+    Writes obj as compact json, with its precompressed copies next to it.
+    Returns the manifest entry of the file (path, size and hash).
+    """
+    content = to_compact_json(obj)
+    write_bytes_if_changed(path, content)
+
+    # mtime=0 so that the same content always gives the same .gz (otherwise it would change at every build)
+    write_bytes_if_changed(path.with_name(path.name + ".gz"), gzip.compress(content, compresslevel=9, mtime=0))
+    if brotli is not None:
+        write_bytes_if_changed(path.with_name(path.name + ".br"), brotli.compress(content))
+
+    return get_manifest_entry(path, content)
+
+
+def make_listing_entry(entry: dict, shard_number: int) -> dict:
+    listing_entry = {short_key: entry.get(attribute) for attribute, short_key in LISTING_KEYS.items()}
+    listing_entry[SHARD_KEY] = shard_number
+    return listing_entry
+
+
+def make_shard_entry(entry: dict) -> dict:
+    """ The attributes of the entry that are not in the listing"""
+    return {attribute: value for attribute, value in entry.items() if attribute not in LISTING_KEYS}
+
+
+def make_split_index(index_list: list[dict]) -> dict:
+    """
+    {path: content} of the listing, the shards and the manifest for the entries of database_index.json,
+    the same files as SplitIndexWriter but in memory (for the preview server)
+    """
+    allowed_entries = [entry for entry in index_list if entry.get("allowed_in_database")]
+    listing = [make_listing_entry(entry, position // DATASETS_PER_SHARD)
+               for position, entry in enumerate(allowed_entries)]
+    files = {LISTING_INDEX_PATH: to_compact_json(listing)}
+    shard_manifest_entries = []
+    for shard_start in range(0, len(allowed_entries), DATASETS_PER_SHARD):
+        shard = {entry["id"]: make_shard_entry(entry)
+                 for entry in allowed_entries[shard_start:shard_start + DATASETS_PER_SHARD]}
+        shard_path = get_shard_path(len(shard_manifest_entries))
+        files[shard_path] = to_compact_json(shard)
+        shard_manifest_entries.append({**get_manifest_entry(shard_path, files[shard_path]), "datasets": len(shard)})
+
+    manifest = {
+        "datasets_per_shard": DATASETS_PER_SHARD,
+        "listing": get_manifest_entry(LISTING_INDEX_PATH, files[LISTING_INDEX_PATH]),
+        "shards": shard_manifest_entries,
+    }
+    files[INDEX_MANIFEST_PATH] = to_compact_json(manifest)
+    return files
+
+
+class SplitIndexWriter:
+    """ Writes the listing, the shards and the manifest, from the entries of database_index.json given one by one"""
+
+    def __init__(self):
+        self.listing = []
+        self.current_shard = dict()
+        self.shard_manifest_entries = []
+        INDEX_SHARDS_FOLDER.mkdir(parents=True, exist_ok=True)
+
+    def _write_current_shard(self):
+        shard_manifest_entry = write_json_output(get_shard_path(len(self.shard_manifest_entries)), self.current_shard)
+        shard_manifest_entry["datasets"] = len(self.current_shard)
+        self.shard_manifest_entries.append(shard_manifest_entry)
+        self.current_shard = dict()
+
+    def add(self, entry: dict):
+        if not entry.get("allowed_in_database"):
+            return
+
+        self.listing.append(make_listing_entry(entry, len(self.shard_manifest_entries)))
+        self.current_shard[entry["id"]] = make_shard_entry(entry)
+        if len(self.current_shard) == DATASETS_PER_SHARD:
+            self._write_current_shard()
+
+    def finish(self):
+        if self.current_shard:
+            self._write_current_shard()
+
+        manifest = {
+            "datasets_per_shard": DATASETS_PER_SHARD,
+            "listing": write_json_output(LISTING_INDEX_PATH, self.listing),
+            "shards": self.shard_manifest_entries,
+        }
+
+        # shards left over from a build that had more datasets
+        current_shard_names = {get_shard_path(shard_number).name
+                               for shard_number in range(len(self.shard_manifest_entries))}
+        # (with their precompressed and hashed copies, see asset_manifest.py)
+        for shard_file in INDEX_SHARDS_FOLDER.glob("shard_*.json*"):
+            if shard_file.name.split(".")[0] + ".json" not in current_shard_names:
+                shard_file.unlink()
+
+        write_json_output(INDEX_MANIFEST_PATH, manifest)
+
+
+class JsonArrayFileWriter:
+    """
+    Writes a json list one item at a time, to a temporary file that replaces path at the end (only if it changed).
+    The file is the same as json.dumps(the_list, ensure_ascii=False, indent=2).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.temporary_path = path.with_name(path.name + ".tmp")
+        self.file = open(self.temporary_path, "w", encoding="utf-8")
+        self.item_count = 0
+
+    def add(self, item):
+        item_json = json.dumps(item, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+        self.file.write(("[\n  " if self.item_count == 0 else ",\n  ") + item_json)
+        self.item_count += 1
+
+    def close(self) -> bool:
+        """ Returns True if the file changed"""
+        self.file.write("[]" if self.item_count == 0 else "\n]")
+        self.file.close()
+        return replace_file_if_changed(self.temporary_path, self.path)
+
+
+def iterate_json_array(path, read_size: int = 1 << 16):
+    """ Yields the items of a json list saved in a file, without loading the whole file"""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as file:
+        buffer = file.read(read_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} does not contain a json list")
+        position = 1
+        at_end_of_file = False
+
+        while True:
+            # skip the spaces and the comma between the items
+            while True:
+                while position < len(buffer) and buffer[position] in " \t\r\n,":
+                    position += 1
+                if position < len(buffer) or at_end_of_file:
+                    break
+                buffer, position = file.read(read_size), 0
+                at_end_of_file = not buffer
+
+            if position >= len(buffer):
+                raise ValueError(f"{path} ends in the middle of the json list")
+            if buffer[position] == "]":
+                return
+
+            try:
+                item, end_position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # the item is not complete yet, read more
+                more_content = file.read(read_size)
+                if not more_content:
+                    raise
+                buffer, position = buffer[position:] + more_content, 0
+                continue
+            yield item
+            position = end_position
@@ -1,12 +1,15 @@
 import html
 import json
-from collections import defaultdict
 import re
 from datetime import datetime
 
 import markdown
 
+from build_stats import logger, timed_field, add_to_counter
+from filter_hierarchy import FilterHierarchy
+from html_sanitisation import DANGEROUS_TAGS_RE, remove_dangerous_tags_and_count, sanitise_dataset_variables
 from paths import FILTER_OPTIONS_FILE
+from render_cache import make_cache_key, load_cached_render, save_cached_render
 
 """
  
@@ -34,15 +37,33 @@ def make_html_bullet_list(items: list[str]) -> str:
     return f"<ul>\n{list_items}\n</ul>"
 
 
-# precompiled regex to remove dangerous tags and their contents (case-insensitive)
-_DANGEROUS_TAGS_RE = re.compile(r"(?is)</?(script|iframe|object|embed|style|form|svg)[^>]*>")
+MARKDOWN_EXTENSIONS = ['fenced_code', 'tables']
 
 
-def remove_dangerous_tags(original_str: str) -> str:
-    # takes a string that will be pasted into the HTML, and removes tags that are dangerous
-    # the markdown should produce h3, table, thead, tr, th, tf, tbody, em, strong, a, img, old, li
+def render_description_markdown(description_md: str) -> (str, int):
+    """
+    Converts the markdown of a long description into HTML, and removes the dangerous tags.
+    Returns the HTML, and the number of dangerous tags that were removed.
+    This is the slowest part of making a page, so the result is kept in the render cache (see render_cache.py).
+    """
+    # anything that changes the result must be in the key
+    # (v2: the number of removed tags is cached, the older entries only had a bool)
+    cache_key = make_cache_key("description-v2", markdown.__version__, ",".join(MARKDOWN_EXTENSIONS),
+                               DANGEROUS_TAGS_RE.pattern, description_md)
+    cached_entry = load_cached_render(cache_key)
+    if cached_entry is not None:
+        add_to_counter("render_cache_hits")
+        return cached_entry["html"], cached_entry["removed_dangerous_tags"]
+    add_to_counter("render_cache_misses")
 
-    return _DANGEROUS_TAGS_RE.sub("", original_str)
+    # use the markdown library to convert markdown into HTML
+    with timed_field("markdown"):
+        description_html = markdown.markdown(description_md, extensions=MARKDOWN_EXTENSIONS)
+    with timed_field("sanitisation"):
+        sanitised_description_html, removed_tag_count = remove_dangerous_tags_and_count(description_html)
+
+    save_cached_render(cache_key, {"html": sanitised_description_html, "removed_dangerous_tags": removed_tag_count})
+    return sanitised_description_html, removed_tag_count
 
 
 _non_alpha_trim = re.compile(r'^[^A-Za-z]+|[^A-Za-z]+$')
@@ -84,27 +105,6 @@ def convert_dates_to_schema_time_range(iso_start: str, iso_end: str) -> str:
     return result_str
 
 
-# Regex to match URLs, with optional protocol
-url_pattern = re.compile(
-    r'(?:(?:https?://)?(?:www\.)?[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})(?:/[^\s]*)?'
-)
-
-
-def convert_str_in_HTML_with_clickable_links(input_str: str):
-    """
-    Convert all URLs in a string into HTML <a> links.
-    Accepts links with or without http(s)://.
-    Might get confused with emails
-    """
-
-    def replace_link(match):
-        url = match.group(0)
-        href = url if url.startswith(('http://', 'https://')) else 'https://' + url
-        return f'<a href="{href}" target="_blank">{url}</a>'
-
-    return url_pattern.sub(replace_link, input_str)
-
-
 def strip_leading_symbols(s: str) -> str:
     """
     Removes leading non-alphabetic characters (symbols, digits, spaces, etc.)
@@ -113,39 +113,33 @@ def strip_leading_symbols(s: str) -> str:
     return re.sub(r'^[^A-Za-z]+', '', s)
 
 
-def invert_filter_options_tree(filter_options: dict[str, set[str]]):
-    """ Given a dict that represents a hierarchy of strings, such as
-    {'A': {'B'{}, 'C'{}}, 'D':{}}
+# the filter options dict, and its hierarchies compiled into bitmasks (see filter_hierarchy.py).
+# this will be used later to add missing categories to csv entries
+filter_options_dict = dict()
+filter_hierarchies = dict()
 
-    It converts it into a dict where, for every string, we know its ancestors:
-    {'A':['A'], 'B':['A'], 'C':['A', 'D':[]}.
 
-    This is used to manage the "filter categories".
+def load_filter_options():
     """
-    entire_dict = defaultdict(set)
-
-    def visit_dict(input_dict: dict, accumulator: set[str]):
-        for key, sub_items in input_dict.items():
-            entire_dict[key] = accumulator
-            visit_dict(sub_items, accumulator.union([key]))
-
-    visit_dict(filter_options, set())
-
-    return entire_dict
+    Reads filter_options.json. It is called when this file is imported, and again by --watch when it changes.
+    The dicts are updated in place, so the modules that imported them see the new options.
+    """
+    try:
+        with open(FILTER_OPTIONS_FILE, "r") as file:
+            new_filter_options_dict = json.load(file)
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            "The filter options file could not be found, is it at website_metadata/filter_options.json?")
+    except json.JSONDecodeError:
+        raise Exception("The JSON file could not be opened, is the format correct?")
 
+    filter_options_dict.clear()
+    filter_options_dict.update(new_filter_options_dict)
+    filter_hierarchies.clear()
+    filter_hierarchies.update({key: FilterHierarchy(filter_options_dict[key]) for key in filter_options_dict})
 
-# prepare the filter options dict, and its inverted form.
-# this will be used later to add missing categories to csv entries
-try:
-    filter_options_dict = json.load(open(FILTER_OPTIONS_FILE, "r"))
-except FileNotFoundError:
-    raise FileNotFoundError(
-        "The filter options file could not be found, is it at website_metadata/filter_options.json?")
-except json.JSONDecodeError:
-    raise Exception("The JSON file could not be opened, is the format correct?")
 
-inverted_filter_options_dict = {key: invert_filter_options_tree(filter_options_dict[key])
-                                for key in filter_options_dict}
+load_filter_options()
 
 
 def add_missing_supercategories(items_present: list[str], filter_name: str):
@@ -154,46 +148,176 @@ def add_missing_supercategories(items_present: list[str], filter_name: str):
     Logically, the user should have ticked all of those,
     but if not this function will add the missing "supercategories".
     Also note that this will not change the order of the existing items, so that they will still make sense.
+    The missing ones are added in the order of filter_options.json, and items that are not in it are left alone.
     """
-    items_present_set = set(items_present)
-    inverted_dict = inverted_filter_options_dict[filter_name]
-    to_add = set()
-    for item_present in items_present_set:
-        to_add.update(inverted_dict[item_present].difference(items_present_set))
-        # since inverted_dict is a default dict, this is safe
+    with timed_field("supercategories"):
+        hierarchy = filter_hierarchies[filter_name]
+        present_mask = hierarchy.mask_of(items_present)
+        missing_mask = hierarchy.ancestors_of(present_mask) & ~present_mask
+
+    return items_present + hierarchy.names_of(missing_mask)
+
+
+"""
+ The attributes that only depend on the value of a single column (keywords, dates, categories...).
+ Many rows have the same values in these columns (the same country, the same list of data types...),
+ so when making all the pages compute_derived_columns goes through the rows one column at a time,
+ and computes the attributes only once for every different value.
+"""
+
+
+def _derive_keywords(keywords_value) -> dict:
+    keywords_raw = html.escape(str(keywords_value or ''))
+    keywords = [html.escape(str(k.strip())).lower() for k in re.split(r'[;,|\n\s]+', keywords_raw) if
+                k.strip()] if keywords_raw else []
+    return {
+        "keywords_html": ", ".join(keywords),
+        # v  needs to be separate because we want them separate in the JSON index, but together elsewhere
+        "keywords": keywords,
+        "keywords_schema": "[" + ",\n".join(f'"{keyword}"' for keyword in keywords) + "]",
+    }
+
+
+def is_allowed(allow_value: str) -> bool:
+    return allow_value.lower() in {"yes", "y", "allow", "allowed"}
+
+
+def is_publicly_shareable(shareability_value: str) -> bool:
+    return "publicly shareable" == shareability_value.lower()
+
+
+def _derive_allowed(allow_value) -> dict:
+    return {"allowed?": is_allowed(allow_value)}
+
+
+def _derive_shareability(shareability_value) -> dict:
+    return {
+        "shareability": shareability_value,
+        "is_accessible_for_free": "true" if is_publicly_shareable(shareability_value) else "false",
+    }
+
 
-    return items_present + list(to_add)
+def _derive_location(country_value) -> dict:
+    locations = add_missing_supercategories([html.escape(str(country_value))], "location")
+    return {"location": locations, "location_html": ", ".join(locations)}
 
 
-def dataset_df_row_to_JSON(row, dataset_code) -> dict:
+def _derive_collection_start(date_value) -> dict:
+    return {"collection_start": date_to_iso(date_value)}
+
+
+def _derive_collection_end(date_value) -> dict:
+    return {"collection_end": date_to_iso(date_value)}
+
+
+def _derive_categories(categories_value) -> dict:
+    categories_list_dirty = list(categories_value.split(", "))
+    categories_list_cleaned = [strip_leading_symbols(category_name) for category_name in categories_list_dirty]
+    categories_list_cleaned = add_missing_supercategories(categories_list_cleaned, "category")
+    return {"categories_list": categories_list_cleaned, "categories_html": ", ".join(categories_list_cleaned)}
+
+
+def _derive_research_fields(research_fields_value) -> dict:
+    research_fields_list = list(research_fields_value.split(", "))
+    return {"research_fields_list": research_fields_list, "research_fields_html": ", ".join(research_fields_list)}
+
+
+def _derive_datatypes(datatypes_value) -> dict:
+    dataset_categories_cleaned = datatypes_value.split(", ")
+    return {
+        "datatypes_list": dataset_categories_cleaned,
+        "datatypes_html": ", ".join(dataset_categories_cleaned),  # i know i know
+    }
+
+
+def _derive_file_extensions(file_extensions_value) -> dict:
+    return {"file_extensions": file_extensions_value, "file_extensions_list": file_extensions_value.split(", ")}
+
+
+def _derive_open_for_collaboration(lifecycle_stage_value) -> dict:
+    return {"open_for_collaboration": "collaboration" in lifecycle_stage_value}
+
+
+# (csv column, value if the column is missing, function that makes the attributes from the value of the column)
+_DERIVED_COLUMNS = [
+    ("dataset_keywords_from_questionnaire", '', _derive_keywords),
+    ("allow", "Missing", _derive_allowed),
+    ("shareability", None, _derive_shareability),
+    ("dataset_country", "No location", _derive_location),
+    ("data_collection_start", None, _derive_collection_start),
+    ("data_collection_end", None, _derive_collection_end),
+    ("dataset_categories_from_questionnaire", "", _derive_categories),
+    ("research_fields", "", _derive_research_fields),
+    ("dataset_datatypes", None, _derive_datatypes),
+    ("file_extensions", "unknown", _derive_file_extensions),
+    ("dataset_lifecycle_stage", None, _derive_open_for_collaboration),
+]
+
+
+def compute_derived_values(row_dict: dict) -> dict:
+    """ The attributes of _DERIVED_COLUMNS for a single row"""
+    derived_values = dict()
+    for column_name, default_value, derive_function in _DERIVED_COLUMNS:
+        derived_values.update(derive_function(row_dict.get(column_name, default_value)))
+    return derived_values
+
+
+def compute_derived_columns(row_dicts: list[dict]) -> list[dict]:
+    """
+    Same as calling compute_derived_values on every row, but one column at a time,
+    using a lookup table so that every different value of a column is only processed once.
+    Note that the rows with the same value share the same lists, so they should not be modified.
+    """
+    derived_rows = [dict() for _ in row_dicts]
+    for column_name, default_value, derive_function in _DERIVED_COLUMNS:
+        lookup_table = dict()
+        for row_dict, derived_values in zip(row_dicts, derived_rows):
+            column_value = row_dict.get(column_name, default_value)
+            if column_value not in lookup_table:
+                lookup_table[column_value] = derive_function(column_value)
+            derived_values.update(lookup_table[column_value])
+    return derived_rows
+
+
+# the attributes that dataset_df_row_to_JSON adds on top of the csv columns.
+# Used to check that the webpage template doesn't contain placeholders that will never be filled.
+DERIVED_DATASET_VARIABLE_NAMES = {
+    "dataset_code", "dataset_title", "keywords_html", "keywords", "keywords_schema", "abstract",
+    "abstract_escaped_for_schema", "allowed?", "shareability", "is_accessible_for_free", "links", "links_html_section",
+    "first_link", "description", "data_collection_methodology", "location", "location_html", "collection_start",
+    "collection_end", "temporal_coverage_for_schema", "collection_start_html", "collection_end_html",
+    "categories_list", "categories_html", "research_fields_list", "research_fields_html", "author_name",
+    "author_contacts", "other_contributors", "datatypes_list", "datatypes_html", "file_extensions",
+    "file_extensions_list", "dataset_lifecycle_stage", "copyright", "usage_instructions", "acknowledgements",
+    "open_for_collaboration", "related_datasets", "related_datasets_html",
+}
+
+
+def dataset_df_row_to_JSON(row, dataset_code, derived_values: dict = None, related_datasets: list = None) -> dict:
     """
     This big method is where all attributes relating to datasets are added.
     Note that the result (result_json) is initially copied from the original row, so
     new columns in the csv are automatically added in the json without having to add process them.
 
+    derived_values are the attributes that only depend on a single column, if they have already been computed
+    for all the rows at once with compute_derived_columns. Otherwise they are computed here.
+    related_datasets is [(code, title)] of the most similar datasets (see related_datasets.py), they need all the rows.
     """
 
-    row_dict = row.to_dict()
+    # the row can be a pandas Series or already a dict (see read_csv_safely.get_database_information_rows)
+    row_dict = row.to_dict() if hasattr(row, "to_dict") else row
     result_json = row_dict.copy()
     result_json["dataset_code"] = str(dataset_code)
     result_json["dataset_title"] = html.escape(str(row_dict.get("dataset_title", f"Dataset {dataset_code}")))
 
-    keywords_raw = html.escape(str(row_dict.get('dataset_keywords_from_questionnaire', '') or ''))
-    keywords = [html.escape(str(k.strip())).lower() for k in re.split(r'[;,|\n\s]+', keywords_raw) if
-                k.strip()] if keywords_raw else []
-    result_json["keywords_html"] = ", ".join(
-        keywords)
-    # v  needs to be separate because we want them separate in the JSON index, but together elsewhere
-    result_json["keywords"] = keywords
-    result_json["keywords_schema"] = "[" + ",\n".join(f'"{keyword}"' for keyword in keywords) + "]"
+    # keywords, categories, dates... (see _DERIVED_COLUMNS)
+    if derived_values is None:
+        with timed_field("derived_columns"):
+            derived_values = compute_derived_values(row_dict)
+    result_json.update(derived_values)
 
     result_json["abstract"] = html.escape(str(row_dict.get("abstract", "Missing abstract")))
     result_json["abstract_escaped_for_schema"] = repr(result_json["abstract"])
-    result_json["allowed?"] = bool(row_dict.get("allow", "Missing").lower() in {"yes", "y", "allow", "allowed"})
-
-    result_json["shareability"] = row_dict.get("shareability")
-    result_json["is_accessible_for_free"] = "true" if (
-            "publicly shareable" == result_json["shareability"].lower()) else "false"
 
     raw_links = row_dict.get("dataset_links_from_questionnaire").split("\n")
     html_links = [f'<a href="{link}">{link}</a>' for link in raw_links]
@@ -210,19 +334,13 @@ def dataset_df_row_to_JSON(row, dataset_code) -> dict:
     result_json["first_link"] = raw_links[0] if len(raw_links) > 0 else "error"
 
     description_md = str(row_dict.get('long_description_from_questionnaire', '') or '')
-    # use the markdown library to convert markdown into HTML
-    description_html = markdown.markdown(description_md, extensions=['fenced_code', 'tables'])
+    # the description is already sanitised here
+    description_html, description_removed_tag_count = render_description_markdown(description_md)
     result_json["description"] = description_html
 
-    result_json["data_collection_methodology"] = convert_str_in_HTML_with_clickable_links(
-        row_dict.get("data_collection_methodology"))
-
-    locations = [html.escape(str(row_dict.get("dataset_country", "No location")))]
-    result_json["location"] = add_missing_supercategories(locations, "location")
-    result_json["location_html"] = ", ".join(result_json["location"])
+    # the links are added by sanitise_dataset_variables (see html_sanitisation.FIELD_HANDLING)
+    result_json["data_collection_methodology"] = row_dict.get("data_collection_methodology")
 
-    result_json["collection_start"] = date_to_iso(row_dict.get('data_collection_start'))
-    result_json["collection_end"] = date_to_iso(row_dict.get('data_collection_end'))
     result_json["temporal_coverage_for_schema"] = convert_dates_to_schema_time_range(result_json["collection_start"],
                                                                                      result_json["collection_end"])
 
@@ -236,30 +354,10 @@ def dataset_df_row_to_JSON(row, dataset_code) -> dict:
     result_json["collection_start_html"] = format_date_for_human(row_dict.get("data_collection_start"))
     result_json["collection_end_html"] = format_date_for_human(row_dict.get("data_collection_end"))
 
-    categories_list_dirty = list(row_dict.get("dataset_categories_from_questionnaire", "").split(", "))
-    categories_list_cleaned = [strip_leading_symbols(category_name) for category_name in categories_list_dirty]
-    categories_list_cleaned = add_missing_supercategories(categories_list_cleaned, "category")
-    categories_html = ", ".join(categories_list_cleaned)
-    result_json["categories_list"] = categories_list_cleaned
-    result_json["categories_html"] = categories_html
-
-    research_fields_list = list(row_dict.get("research_fields", "").split(", "))
-    research_fields_html = ", ".join(research_fields_list)
-
-    result_json["research_fields_list"] = research_fields_list
-    result_json["research_fields_html"] = research_fields_html
-
     result_json["author_name"] = row_dict.get('author_name', "Unknown Author")
     result_json["author_contacts"] = row_dict.get('author_contacts', "Missing author contacts")
     result_json["other_contributors"] = row_dict.get('other_contributors', "")
 
-    dataset_categories_cleaned = row_dict.get("dataset_datatypes").split(", ")
-    result_json["datatypes_list"] = dataset_categories_cleaned
-    result_json["datatypes_html"] = ", ".join(dataset_categories_cleaned)  # i know i know
-
-    result_json["file_extensions"] = row_dict.get("file_extensions", "unknown")
-    result_json["file_extensions_list"] = result_json["file_extensions"].split(", ")
-
     result_json["dataset_lifecycle_stage"] = row_dict.get("dataset_lifecycle_stage")
 
     result_json["copyright"] = row_dict.get("copyright")
@@ -269,21 +367,24 @@ def dataset_df_row_to_JSON(row, dataset_code) -> dict:
 
     result_json["acknowledgements"] = row_dict.get("acknowledgements")
 
-    result_json["open_for_collaboration"] = "collaboration" in result_json["dataset_lifecycle_stage"]
-
-    # remove dangerous tags anywhere
-    for key in result_json:
-        old_content = result_json[key]
-        if isinstance(old_content, str):
-            new_content = remove_dangerous_tags(old_content)
-            result_json[key] = new_content
-
-            if old_content != new_content:
-                print("WARNING: the page contained dangerous HTML!!!")
+    related_datasets = related_datasets or []
+    result_json["related_datasets"] = [related_code for related_code, _ in related_datasets]
+    result_json["related_datasets_html"] = make_html_bullet_list(
+        [f'<a href="{related_code}.html">{related_title}</a>' for related_code, related_title in related_datasets]
+    ) or "None"
+
+    # remove dangerous tags anywhere (and make the links clickable)
+    removed_tag_counts = sanitise_dataset_variables(result_json)
+    if description_removed_tag_count:
+        removed_tag_counts["description"] = description_removed_tag_count
+    if removed_tag_counts:
+        add_to_counter("dangerous_tags_removed", sum(removed_tag_counts.values()))
+        removed_tags_summary = ", ".join(f"{key}: {count}" for key, count in removed_tag_counts.items())
+        logger.warning(f"WARNING: the page contained dangerous HTML!!! Removed tags from {removed_tags_summary}")
 
     # Just in case there is a column without a name in the second row.
     if float("NaN") in result_json:
-        print("WARNING: you might have recently added a question to the form, which would have added a column in the spreadsheet. Remember to put a name for it in the second row!")
+        logger.warning("WARNING: you might have recently added a question to the form, which would have added a column in the spreadsheet. Remember to put a name for it in the second row!")
         del result_json[float("NaN")]
     #
     return result_json
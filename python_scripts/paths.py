@@ -3,10 +3,21 @@ from pathlib import Path
 CSV_PATH = Path('database_information.csv')
 WEBPAGES_FOLDER = Path('website_contents', 'database_webpages')
 INDEX_PATH = Path('website_metadata', 'database_index.json')
+SEARCH_INDEX_PATH = Path('website_metadata', 'search_index.json')
+LISTING_INDEX_PATH = Path('website_metadata', 'database_listing.json')
+INDEX_SHARDS_FOLDER = Path('website_metadata', 'index_shards')
+INDEX_MANIFEST_PATH = Path('website_metadata', 'index_manifest.json')
+FACET_COUNTS_PATH = Path('website_metadata', 'facet_counts.json')
+ASSET_MANIFEST_PATH = Path('website_metadata', 'asset_manifest.json')
 TEMPLATE_FILE = Path("website_contents", "database_webpages", "dataset_webpage_template.html")
 
 FILTER_OPTIONS_FILE = Path('website_metadata', 'filter_options.json')
 GENERATION_METADATA_FILE = Path('website_metadata', 'website_generation_metadata.json')
+BUILD_MANIFEST_FILE = Path('website_metadata', 'build_manifest.json')
+DATASET_IDS_FILE = Path('website_metadata', 'dataset_ids.json')
+
+# not committed, see render_cache.py
+RENDER_CACHE_FOLDER = Path('.cache', 'render_cache')
 
 
 def get_webpage_path(dataset_code: str) -> Path:
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+import argparse
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from build_manifest import compute_build_fingerprint, compute_row_hash
+from build_stats import logger, configure_logging
+from csv_validation import validate_rows
+from dataset_ids import DatasetIds, make_redirect_page
+from dataset_rendering import make_index_entry_from_dataset_variables
+from index_output import make_split_index, to_compact_json
+from parse_dataset_information import dataset_df_row_to_JSON, compute_derived_columns, load_filter_options, is_allowed
+from paths import CSV_PATH, TEMPLATE_FILE, FILTER_OPTIONS_FILE, INDEX_PATH, WEBPAGES_FOLDER, ASSET_MANIFEST_PATH, \
+    SEARCH_INDEX_PATH, LISTING_INDEX_PATH, INDEX_SHARDS_FOLDER, INDEX_MANIFEST_PATH, FACET_COUNTS_PATH
+from read_csv_safely import get_database_information_rows
+from related_datasets import RelatedDatasetsFinder
+from search_index import build_search_index, FacetCounter
+from watch_mode import get_signatures
+from webpage_template import CompiledTemplate
+
+"""
+ A local preview of the website, without writing the pages first.
+
+ Usage (from the top-level directory):
+     python python_scripts/preview_server.py [--port 8000] [--cache-size 256]
+ and open http://localhost:8000/website_contents/
+
+ The static files are served from the repository as they are, except:
+     * website_contents/database_webpages/NNNNN.html, rendered from the row of the csv when it is requested
+       (the codes are the ones of the last build, see dataset_ids.py, and the redirects of removed datasets too)
+     * the index files of website_metadata (database_index.json, the listing, the shards and their manifest,
+       search_index.json and facet_counts.json), all made from the rows of the csv when one of them is requested
+ asset_manifest.json is not served, so that the pages fetch the files by their usual names
+ and not the hashed copies of the last build (see asset_manifest.py).
+
+ The rendered pages are kept in an LRU cache of --cache-size pages. A cached page is rendered again
+ when the hash of its row changes (the hash also covers the template, filter_options.json and the related datasets,
+ like in build_manifest.py).
+ The csv, the template and the filter options are read again when they change, which is checked at every request.
+ Responses have an ETag (a 304 is sent back for If-None-Match) and are gzipped when the browser accepts it.
+"""
+
+DEFAULT_PORT = 8000
+DEFAULT_CACHE_SIZE = 256
+
+# smaller responses are not worth compressing
+MIN_BYTES_TO_GZIP = 1024
+
+REPOSITORY_FOLDER = Path(__file__).resolve().parent.parent
+
+# the files of website_metadata that are made from the csv (and the shards, in INDEX_SHARDS_FOLDER)
+PREVIEW_METADATA_PATHS = {INDEX_PATH, SEARCH_INDEX_PATH, LISTING_INDEX_PATH, INDEX_MANIFEST_PATH, FACET_COUNTS_PATH}
+
+
+class RenderedResponse:
+    def __init__(self, body: bytes, content_type: str, source_hash: str):
+        self.body = body
+        self.content_type = content_type
+        self.source_hash = source_hash  # the response is out of date when this changes
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self._gzipped_body = None
+
+    def get_gzipped_body(self) -> bytes:
+        if self._gzipped_body is None:
+            self._gzipped_body = gzip.compress(self.body, compresslevel=6, mtime=0)
+        return self._gzipped_body
+
+
+class PreviewSite:
+    """ The parsed csv and the cache of rendered responses, shared by all the request threads"""
+
+    def __init__(self, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.rendered_pages = OrderedDict()  # dataset code -> RenderedResponse, the least recently used first
+        self.rendered_metadata = dict()  # path in website_metadata -> RenderedResponse
+        self.metadata_hash = None  # the csv_hash of rendered_metadata
+        self.input_signatures = None
+        self.template = None
+        self.build_fingerprint = None
+        self.rows_by_code = dict()
+        self.redirects = dict()
+        self.related_datasets = dict()
+        self.row_hashes = dict()
+        self.csv_hash = None
+
+    def reload_if_changed(self):
+        """ Reads the csv, template and filter options again if some of them changed since the last request"""
+        input_paths = [CSV_PATH, TEMPLATE_FILE, FILTER_OPTIONS_FILE]
+        new_signatures = get_signatures(input_paths)
+        if new_signatures == self.input_signatures:
+            return
+
+        start_time = time.perf_counter()
+        if self.input_signatures is not None and new_signatures[FILTER_OPTIONS_FILE] != \
+                self.input_signatures[FILTER_OPTIONS_FILE]:
+            load_filter_options()
+        self.template = CompiledTemplate(TEMPLATE_FILE.read_text(encoding="utf-8"))
+        self.build_fingerprint = compute_build_fingerprint()
+
+        rows = list(get_database_information_rows())
+        # dataset_ids.json is only read, the codes of the new rows are the ones the next build will give them
+        dataset_ids = DatasetIds.load()
+        self.rows_by_code = {dataset_ids.assign(index, row): row for index, row in rows}
+        dataset_ids.finish({dataset_code for dataset_code, row in self.rows_by_code.items()
+                            if is_allowed(row.get("allow", "Missing"))})
+        self.redirects = dataset_ids.redirects
+        # the preview still works with some bad rows, but the build would fail
+        csv_validator = validate_rows(rows)
+        if not csv_validator.is_valid():
+            logger.warning(f"WARNING: the generator would refuse this csv:\n{csv_validator.get_report()}")
+        related_datasets_finder = RelatedDatasetsFinder()
+        related_datasets_finder.add_rows(list(self.rows_by_code.items()))
+        self.related_datasets = related_datasets_finder.build()
+        self.row_hashes = {dataset_code: compute_row_hash(row, self.build_fingerprint,
+                                                          self.related_datasets.get(dataset_code))
+                           for dataset_code, row in self.rows_by_code.items()}
+        self.csv_hash = hashlib.sha256("".join(self.row_hashes.values()).encode("utf-8")).hexdigest()
+        self.input_signatures = new_signatures
+        logger.info(f"Read {len(self.rows_by_code)} rows in {time.perf_counter() - start_time:.3f}s")
+
+    def get_page(self, dataset_code: str):
+        """
+        The rendered page of a dataset (or the redirect of a removed one),
+        None if there is no such dataset or it is not allowed
+        """
+        with self.lock:
+            self.reload_if_changed()
+            row = self.rows_by_code.get(dataset_code)
+            if row is None:
+                if dataset_code in self.redirects:
+                    redirect_page = make_redirect_page(self.redirects[dataset_code]).encode("utf-8")
+                    return RenderedResponse(redirect_page, "text/html; charset=utf-8", self.csv_hash)
+                return None
+            row_hash = self.row_hashes[dataset_code]
+
+            cached_page = self.rendered_pages.get(dataset_code)
+            if cached_page is not None and cached_page.source_hash == row_hash:
+                self.rendered_pages.move_to_end(dataset_code)
+                return cached_page
+
+            dataset_variables = dataset_df_row_to_JSON(row, dataset_code,
+                                                       related_datasets=self.related_datasets.get(dataset_code))
+            if not dataset_variables["allowed?"]:
+                return None
+            page = RenderedResponse(self.template.render(dataset_variables).encode("utf-8"),
+                                    "text/html; charset=utf-8", row_hash)
+            self.rendered_pages[dataset_code] = page
+            if len(self.rendered_pages) > self.cache_size:
+                self.rendered_pages.popitem(last=False)
+            logger.debug(f"Rendered {dataset_code} ({dataset_variables['dataset_title']})")
+            return page
+
+    def get_metadata_file(self, path: Path):
+        """
+        A file of website_metadata made from every row of the csv (like generate_website_content.py),
+        None if the build would not make it (like a shard after the last one)
+        """
+        with self.lock:
+            self.reload_if_changed()
+            if self.metadata_hash != self.csv_hash:
+                self._render_metadata()
+            return self.rendered_metadata.get(path)
+
+    def _render_metadata(self):
+        """ The index files, the same as the ones the generator writes (see index_output.py and search_index.py)"""
+        start_time = time.perf_counter()
+        codes_and_rows = list(self.rows_by_code.items())
+        all_derived_values = compute_derived_columns([row for _, row in codes_and_rows])
+        index_list = []
+        for (dataset_code, row), derived_values in zip(codes_and_rows, all_derived_values):
+            dataset_variables = dataset_df_row_to_JSON(row, dataset_code, derived_values,
+                                                       self.related_datasets.get(dataset_code))
+            if dataset_variables["allowed?"]:
+                index_list.append(make_index_entry_from_dataset_variables(dataset_code, dataset_variables))
+
+        facet_counter = FacetCounter()
+        for entry in index_list:
+            facet_counter.add(entry)
+        metadata_files = {
+            INDEX_PATH: json.dumps(index_list, ensure_ascii=False, indent=2).encode("utf-8"),
+            SEARCH_INDEX_PATH: to_compact_json(build_search_index(index_list)),
+            FACET_COUNTS_PATH: to_compact_json(facet_counter.build()),
+            **make_split_index(index_list),
+        }
+        self.rendered_metadata = {path: RenderedResponse(content, "application/json", self.csv_hash)
+                                  for path, content in metadata_files.items()}
+        self.metadata_hash = self.csv_hash
+        logger.info(f"Made the index of {len(index_list)} datasets in {time.perf_counter() - start_time:.3f}s")
+
+
+class PreviewRequestHandler(SimpleHTTPRequestHandler):
+    def __init__(self, *args, preview_site: PreviewSite, **kwargs):
+        self.preview_site = preview_site
+        super().__init__(*args, **kwargs)
+
+    def get_rendered_response(self):
+        """ The response for the pages that are rendered on demand, None for the static files"""
+        request_path = Path(self.path.split("?")[0].split("#")[0].lstrip("/"))
+        if request_path in PREVIEW_METADATA_PATHS or request_path.parent == INDEX_SHARDS_FOLDER:
+            return self.preview_site.get_metadata_file(request_path) or False
+        if request_path == ASSET_MANIFEST_PATH:
+            return False
+        if request_path.parent == WEBPAGES_FOLDER and request_path.suffix == ".html" and request_path.stem.isdigit():
+            return self.preview_site.get_page(request_path.stem) or False
+        return None
+
+    def do_GET(self):
+        self.send_rendered_response(include_body=True)
+
+    def do_HEAD(self):
+        self.send_rendered_response(include_body=False)
+
+    def send_rendered_response(self, include_body: bool):
+        try:
+            rendered_response = self.get_rendered_response()
+        except Exception as e:
+            logger.warning(f"WARNING: could not render {self.path}: {e}")
+            self.send_error(500, f"Could not render the page: {e}")
+            return
+
+        if rendered_response is None:
+            # a static file
+            if include_body:
+                super().do_GET()
+            else:
+                super().do_HEAD()
+            return
+        if rendered_response is False:
+            self.send_error(404, "Not available in the preview")
+            return
+
+        if rendered_response.etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", rendered_response.etag)
+            self.end_headers()
+            return
+
+        body = rendered_response.body
+        use_gzip = "gzip" in self.headers.get("Accept-Encoding", "") and len(body) >= MIN_BYTES_TO_GZIP
+        if use_gzip:
+            body = rendered_response.get_gzipped_body()
+
+        self.send_response(200)
+        self.send_header("Content-Type", rendered_response.content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", rendered_response.etag)
+        self.send_header("Cache-Control", "no-cache")  # always check the ETag, the csv might have changed
+        self.send_header("Vary", "Accept-Encoding")
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        if include_body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves the website, rendering the dataset pages from the csv on demand.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--bind", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE,
+                        help="number of rendered pages kept in memory")
+    parser.add_argument("--quiet", action="store_true", help="don't show a message for every request")
+    args = parser.parse_args()
+
+    configure_logging(quiet=args.quiet)
+    preview_site = PreviewSite(cache_size=args.cache_size)
+    with preview_site.lock:
+        preview_site.reload_if_changed()
+
+    handler = partial(PreviewRequestHandler, preview_site=preview_site, directory=str(REPOSITORY_FOLDER))
+    with ThreadingHTTPServer((args.bind, args.port), handler) as server:
+        logger.info(f"Serving the preview at http://{args.bind}:{args.port}/website_contents/ (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("Stopped the preview server.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,78 +1,102 @@
+import codecs
+import csv
 import re
 
-import pandas as pd
-
 from paths import CSV_PATH
 
 
-# this file is to read the csv and make it bomb proof. The only thing you should import is get_database_information_df
-
-def read_csv_safely(csv_path):
-    def read_dataset_with_encoding(encoding):
-        second_row = pd.read_csv(csv_path, nrows=2, sep=",", encoding=encoding, dtype=str).iloc[0]
+# this file is to read the csv and make it bomb proof.
+# The only thing you should import is get_database_information_rows (or get_database_information_df if you want pandas)
 
-        # Now read the full CSV, using the extracted values as column names
-        df = pd.read_csv(csv_path, header=None, skiprows=2, encoding=encoding, dtype=str)
-        df.columns = second_row
-        return df
+# the strings that pandas reads as NaN (which used to become empty strings), kept so that the result is the same
+_MISSING_VALUE_STRINGS = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA',
+    'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+}
 
-    try:
-        df = read_dataset_with_encoding(encoding="utf-8-sig")  # excel-generated csv
-    except Exception:
-        df = read_dataset_with_encoding(encoding="utf-8")
 
-    # remove the BOM character, just in case
-    df.columns = df.columns.str.strip().str.replace("\ufeff", "")
+def detect_csv_encoding(csv_path) -> str:
+    """ Looks at the first bytes of the file for a BOM. Excel likes to add one."""
+    with open(csv_path, "rb") as file:
+        first_bytes = file.read(4)
+    if first_bytes.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"  # excel-generated csv
+    if first_bytes.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    return "utf-8"
 
-    # The dataframe is likely to contain many empty rows. Remove those where the id is not a number
-    # note that at this stage the column names have not been replaced yet.
-    df = df[~df[df.columns[0]].isna()]
 
-    # Ensure string values and fill NaN with empty strings
-    df = df.astype(object).where(pd.notnull(df), '')
+def _normalise_column_name(name: str):
+    # remove the BOM character, just in case.
+    # A column without a name in the second row is a NaN, like it was with pandas
+    if name in _MISSING_VALUE_STRINGS:
+        return float("NaN")
+    return name.strip().replace("\ufeff", "")
 
-    return df
 
+def iterate_csv_rows(csv_path):
+    """
+    Reads the csv once, and yields (index, row_dict) for every row, like df.iterrows().
+    The column names are the ones in the second row (the first row has the questions of the form).
+    Missing values are empty strings, and the empty rows (where the first column is empty) are skipped,
+    but they still count for the index.
+    """
+    with open(csv_path, "r", encoding=detect_csv_encoding(csv_path), newline="") as file:
+        csv_reader = csv.reader(file)
+        # blank lines don't count as rows at all
+        non_blank_rows = (csv_row for csv_row in csv_reader if csv_row)
 
-def remove_punctuation_and_make_lowercase(s: str) -> str:
-    return re.sub(r"[^a-z0-9]", "", s.lower()) if isinstance(s, str) else s
-
+        next(non_blank_rows, None)  # the questions
+        column_names = [_normalise_column_name(name) for name in next(non_blank_rows, [])]
 
-def get_database_information_df():
-    # Make sure CSV exists
-    if not CSV_PATH.exists():
-        raise SystemExit(
-            f"CSV not found at {CSV_PATH.resolve()} - place database_information.csv in top-level directory!")
+        for index, csv_row in enumerate(non_blank_rows):
+            # The csv is likely to contain many empty rows. Remove those where the id is missing
+            if not csv_row or csv_row[0] in _MISSING_VALUE_STRINGS:
+                continue
 
-    df = read_csv_safely(CSV_PATH)
+            values = ['' if value in _MISSING_VALUE_STRINGS else value for value in csv_row[:len(column_names)]]
+            values += [''] * (len(column_names) - len(values))
+            yield index, dict(zip(column_names, values))
 
-    df['allow'] = df['allow'].str.strip()
-
-    return df
 
+def read_csv_safely(csv_path):
+    """ Same as iterate_csv_rows, but as a pandas DataFrame (the index is the same as the one of the rows)"""
+    import pandas as pd
 
-def check_database_allow_column_is_valid(df: pd.DataFrame) -> (bool, str):
-    """Check if a DataFrame is valid based on the 'allow' column. the return type is Golang - esque"""
-    # Check if column exists
-    if 'allow' not in df.columns:
-        return False, "Missing 'allow' column"
+    indices, row_dicts = [], []
+    for index, row_dict in iterate_csv_rows(csv_path):
+        indices.append(index)
+        row_dicts.append(row_dict)
+    return pd.DataFrame.from_records(row_dicts, index=indices)
 
-    # Check each row for invalid or empty 'allow' values
-    for i, row in df.iterrows():
-        val = str(row['allow']).strip()
-        if not val:
-            dataset_name = row.get('dataset_title', 'dataset name unavailable')
-            return False, f"Invalid 'allow' cell for dataset '{dataset_name}'"
 
-    return True, "ok"
+def remove_punctuation_and_make_lowercase(s: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", s.lower()) if isinstance(s, str) else s
 
 
+def _check_csv_exists():
+    # Make sure CSV exists
+    if not CSV_PATH.exists():
+        raise SystemExit(
+            f"CSV not found at {CSV_PATH.resolve()} - place database_information.csv in top-level directory!")
 
 
+def get_database_information_rows():
+    """ Yields (index, row_dict) for every row of the csv, without needing pandas"""
+    _check_csv_exists()
 
+    for index, row_dict in iterate_csv_rows(CSV_PATH):
+        if 'allow' in row_dict:
+            row_dict['allow'] = row_dict['allow'].strip()
+        yield index, row_dict
 
 
+def get_database_information_df():
+    _check_csv_exists()
 
+    df = read_csv_safely(CSV_PATH)
 
+    df['allow'] = df['allow'].str.strip()
 
+    return df
 
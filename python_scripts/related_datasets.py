@@ -0,0 +1,231 @@
+import html
+import math
+import re
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from parse_dataset_information import compute_derived_columns
+
+"""
+ Finds the most similar datasets of every dataset, for the "Related datasets" section of the webpages.
+
+ Every dataset is a TF-IDF vector of its keywords, categories (with their supercategories), research fields
+ and the words of its abstract, normalised to length 1. The similarity of two datasets is the dot product of their
+ vectors (cosine similarity), and the RELATED_DATASETS_COUNT most similar ones are kept.
+
+ The vectors are sparse (a few dozen terms out of thousands), so instead of comparing every pair of datasets,
+ the products are computed with numpy from the postings of the terms (which datasets contain a term):
+ a dataset is only compared with the datasets that share a term with it.
+ The datasets are processed in blocks of about MAX_PAIRS_PER_BLOCK (dataset, other dataset) pairs, so the memory
+ used doesn't depend on the size of the catalogue. Terms that are in more than MAX_DATASETS_PER_TERM datasets
+ (or in more than half of them) are ignored: they say very little about similarity, and they would make
+ every dataset be compared with every other one.
+
+ The results only depend on the datasets and their codes (not on the order of the rows),
+ so they are the same from one build to the next.
+"""
+
+RELATED_DATASETS_COUNT = 5
+
+# datasets that are less similar than this are not shown, even if there are no better ones
+MIN_SIMILARITY = 0.05
+
+MAX_DATASETS_PER_TERM = 2000
+# the size of the arrays used for a block of datasets
+MAX_PAIRS_PER_BLOCK = 250_000
+MAX_SIMILARITIES_PER_BLOCK = 500_000
+
+# how much every kind of term counts, compared to the others
+KEYWORD_WEIGHT = 1.0
+CATEGORY_WEIGHT = 1.0
+RESEARCH_FIELD_WEIGHT = 1.0
+ABSTRACT_WEIGHT = 0.5
+
+_ABSTRACT_WORD_RE = re.compile(r"[^\W_]{3,}")
+_STOP_WORDS = {
+    "the", "and", "for", "with", "this", "that", "are", "from", "was", "were", "which", "has", "have", "been",
+    "its", "their", "into", "also", "such", "can", "all", "not", "but", "these", "other", "more", "between",
+    "about", "each", "they", "our", "who", "how", "than", "over", "per", "any", "data", "dataset", "datasets",
+}
+
+
+def get_abstract_words(abstract: str) -> Counter:
+    return Counter(word for word in _ABSTRACT_WORD_RE.findall(abstract.lower()) if word not in _STOP_WORDS)
+
+
+class RelatedDatasetsFinder:
+    """ Finds the related datasets (see the top of this file), from the datasets given one by one"""
+
+    def __init__(self, related_count: int = RELATED_DATASETS_COUNT):
+        self.related_count = related_count
+        self.dataset_codes = []
+        self.dataset_titles = []
+        self.term_numbers = dict()  # "k:keyword", "c:category"... -> column of the term
+        # the (not yet weighted by idf) vectors of the datasets, one after the other
+        self.dataset_ends = array("q")
+        self.term_columns = array("q")
+        self.term_values = array("d")
+
+    def add(self, dataset_code: str, dataset_title: str, keywords: list, categories: list, research_fields: list,
+            abstract: str):
+        """ dataset_title is the one shown on the webpages (already escaped)"""
+        self.dataset_codes.append(dataset_code)
+        self.dataset_titles.append(dataset_title)
+
+        term_values = dict()
+        for prefix, values, weight in (("k:", keywords, KEYWORD_WEIGHT), ("c:", categories, CATEGORY_WEIGHT),
+                                       ("r:", research_fields, RESEARCH_FIELD_WEIGHT)):
+            for value in values:
+                value = str(value).strip().lower()
+                if value:
+                    term_values[prefix + value] = weight
+        for word, word_count in get_abstract_words(str(abstract or "")).items():
+            term_values["a:" + word] = ABSTRACT_WEIGHT * (1 + math.log(word_count))
+
+        term_numbers = self.term_numbers
+        self.term_columns.extend([term_numbers.setdefault(term, len(term_numbers)) for term in term_values])
+        self.term_values.extend(term_values.values())
+        self.dataset_ends.append(len(self.term_columns))
+
+    def add_rows(self, codes_and_rows: list):
+        """ Adds the allowed datasets of [(dataset_code, row)] (rows of the csv)"""
+        for (dataset_code, row), derived_values in zip(codes_and_rows,
+                                                       compute_derived_columns([row for _, row in codes_and_rows])):
+            if not derived_values["allowed?"]:
+                continue
+            # the title as it is on the pages (see dataset_df_row_to_JSON)
+            dataset_title = html.escape(str(row.get("dataset_title", f"Dataset {dataset_code}")))
+            self.add(dataset_code, dataset_title, derived_values["keywords"], derived_values["categories_list"],
+                     derived_values["research_fields_list"], row.get("abstract"))
+
+    def _make_normalised_vectors(self):
+        """ The TF-IDF vectors of the datasets, without the ignored terms, as (rows, columns, values) of the terms"""
+        dataset_count = len(self.dataset_codes)
+        columns = np.array(self.term_columns, dtype=np.int64)
+        values = np.array(self.term_values, dtype=np.float64)
+        term_counts = np.diff(np.array(self.dataset_ends, dtype=np.int64), prepend=0)
+        rows = np.repeat(np.arange(dataset_count, dtype=np.int64), term_counts)
+
+        datasets_per_term = np.bincount(columns, minlength=len(self.term_numbers))
+        max_datasets_per_term = min(MAX_DATASETS_PER_TERM, dataset_count // 2)
+        # a term that is in a single dataset can't make it similar to another one
+        is_term_used = (datasets_per_term >= 2) & (datasets_per_term <= max_datasets_per_term)
+        kept = is_term_used[columns]
+        rows, columns, values = rows[kept], columns[kept], values[kept]
+
+        idf = np.log(dataset_count / np.maximum(datasets_per_term, 1))
+        values = values * idf[columns]
+        norms = np.sqrt(np.bincount(rows, weights=values * values, minlength=dataset_count))
+        values = values / norms[rows]
+        return rows, columns, values
+
+    def build(self) -> dict:
+        """ {dataset code: [(code, title) of the related datasets, the most similar first]}"""
+        dataset_count = len(self.dataset_codes)
+        related_datasets = {dataset_code: [] for dataset_code in self.dataset_codes}
+        if dataset_count < 2:
+            return related_datasets
+
+        rows, columns, values = self._make_normalised_vectors()
+        row_starts = np.searchsorted(rows, np.arange(dataset_count + 1))
+
+        # the postings of every term: the datasets that contain it (sorted), and the value of the term for them
+        posting_order = np.argsort(columns, kind="stable")
+        posting_rows, posting_values = rows[posting_order], values[posting_order]
+        posting_lengths = np.bincount(columns, minlength=len(self.term_numbers))
+        posting_starts = np.concatenate(([0], np.cumsum(posting_lengths)))
+
+        # number of pairs that every dataset makes with the datasets that share a term with it
+        pairs_per_dataset = np.bincount(rows, weights=posting_lengths[columns], minlength=dataset_count)
+        cumulative_pairs = np.concatenate(([0], np.cumsum(pairs_per_dataset)))
+        max_block_size = max(1, MAX_SIMILARITIES_PER_BLOCK // dataset_count)
+
+        # datasets that are as similar are sorted by code, so that moving rows in the csv doesn't change anything
+        dataset_codes = self.dataset_codes
+        code_order = sorted(range(dataset_count), key=lambda row: (len(dataset_codes[row]), dataset_codes[row]))
+        code_ranks = np.empty(dataset_count, dtype=np.int64)
+        code_ranks[code_order] = np.arange(dataset_count)
+
+        block_start = 0
+        while block_start < dataset_count:
+            block_end = int(np.searchsorted(cumulative_pairs, cumulative_pairs[block_start] + MAX_PAIRS_PER_BLOCK,
+                                            side="right")) - 1
+            block_end = min(max(block_end, block_start + 1), block_start + max_block_size, dataset_count)
+            self._add_related_datasets_of_block(
+                related_datasets, block_start, block_end, rows, columns, values, row_starts,
+                posting_rows, posting_values, posting_lengths, posting_starts, code_ranks)
+            block_start = block_end
+        return related_datasets
+
+    def _add_related_datasets_of_block(self, related_datasets: dict, block_start: int, block_end: int,
+                                       rows, columns, values, row_starts,
+                                       posting_rows, posting_values, posting_lengths, posting_starts, code_ranks):
+        """ The similarities of the datasets of the block with all the others (a sparse matrix product)"""
+        dataset_count = len(self.dataset_codes)
+        first_term, last_term = row_starts[block_start], row_starts[block_end]
+        block_rows, block_columns = rows[first_term:last_term], columns[first_term:last_term]
+        block_values = values[first_term:last_term]
+
+        # every term of a dataset of the block, paired with every dataset of the postings of that term
+        lengths = posting_lengths[block_columns]
+        pair_count = int(lengths.sum())
+        if pair_count == 0:
+            return
+        offsets_in_postings = np.arange(pair_count) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        posting_positions = np.repeat(posting_starts[block_columns], lengths) + offsets_in_postings
+        pair_rows = np.repeat(block_rows - block_start, lengths)
+        pair_other_rows = posting_rows[posting_positions]
+        pair_products = np.repeat(block_values, lengths) * posting_values[posting_positions]
+
+        # the similarities are added up in a (datasets of the block) x (datasets that share a term with them) matrix
+        is_other_row = np.zeros(dataset_count, dtype=bool)
+        is_other_row[pair_other_rows] = True
+        other_rows = np.flatnonzero(is_other_row)
+        other_row_numbers = np.zeros(dataset_count, dtype=np.int64)
+        other_row_numbers[other_rows] = np.arange(len(other_rows))
+        block_size, other_row_count = block_end - block_start, len(other_rows)
+        similarities = np.bincount(pair_rows * other_row_count + other_row_numbers[pair_other_rows],
+                                   weights=pair_products, minlength=block_size * other_row_count)
+        similarities = similarities.reshape(block_size, other_row_count)
+
+        # a dataset is not related to itself
+        block_dataset_rows = np.arange(block_start, block_end)
+        has_terms = is_other_row[block_dataset_rows]
+        similarities[block_dataset_rows[has_terms] - block_start, other_row_numbers[block_dataset_rows[has_terms]]] = 0
+
+        # only the datasets at least as similar as the related_count-th most similar one are looked at.
+        # (a few passes of argmax are faster than np.partition, for a small related_count)
+        min_similarities = np.full(block_size, MIN_SIMILARITY)
+        if other_row_count > self.related_count:
+            block_row_numbers = np.arange(block_size)
+            removed_columns, removed_similarities = [], []
+            for _ in range(self.related_count):
+                most_similar_columns = similarities.argmax(axis=1)
+                removed_columns.append(most_similar_columns)
+                removed_similarities.append(similarities[block_row_numbers, most_similar_columns])
+                similarities[block_row_numbers, most_similar_columns] = -1
+            for most_similar_columns, most_similar_similarities in zip(reversed(removed_columns),
+                                                                       reversed(removed_similarities)):
+                similarities[block_row_numbers, most_similar_columns] = most_similar_similarities
+            # minus a little, because of the rounding below
+            min_similarities = np.maximum(min_similarities, removed_similarities[-1] - 1e-8)
+        similar_rows, similar_other_row_numbers = np.nonzero(similarities >= min_similarities[:, None])
+        # rounded, so that datasets with the same terms are exactly as similar, and the order doesn't depend on
+        # the last digits of the sums
+        similar_similarities = np.round(similarities[similar_rows, similar_other_row_numbers], 9)
+        is_similar_enough = similar_similarities >= MIN_SIMILARITY
+        similar_rows = similar_rows[is_similar_enough]
+        similar_other_row_numbers = similar_other_row_numbers[is_similar_enough]
+        similar_similarities = similar_similarities[is_similar_enough]
+
+        # for every dataset, the most similar first (and the smallest code if they are as similar)
+        order = np.lexsort((code_ranks[other_rows[similar_other_row_numbers]], -similar_similarities, similar_rows))
+        similar_rows, similar_other_row_numbers = similar_rows[order], similar_other_row_numbers[order]
+        ranks = np.arange(len(similar_rows)) - np.searchsorted(similar_rows, similar_rows)
+        kept = ranks < self.related_count
+        for row, other_row in zip((similar_rows[kept] + block_start).tolist(),
+                                  other_rows[similar_other_row_numbers[kept]].tolist()):
+            related_datasets[self.dataset_codes[row]].append((self.dataset_codes[other_row],
+                                                              self.dataset_titles[other_row]))
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from build_stats import logger
+from paths import RENDER_CACHE_FOLDER
+
+"""
+ A cache on disk for things that are slow to render, like the markdown of the long descriptions.
+
+ Every entry is a small json file, named after the hash of everything that went into it (the key),
+ so an entry never has to be invalidated: if the text or the markdown library change, the key changes.
+ The entries are written to a temporary file and then renamed, so several processes (--jobs, or two builds
+ sharing the folder through the CI cache) can write at the same time without anybody reading half a file.
+
+ When an entry is used its modification time is updated, and prune_render_cache deletes the entries that
+ were used the longest time ago when the folder gets too big.
+"""
+
+RENDER_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# temporary files older than this were left by a process that crashed
+_STALE_TEMPORARY_FILE_SECONDS = 60 * 60
+
+# None means that the cache is disabled
+_render_cache_folder = RENDER_CACHE_FOLDER
+
+
+def set_render_cache_folder(folder):
+    global _render_cache_folder
+    _render_cache_folder = folder
+
+
+def get_render_cache_folder():
+    return _render_cache_folder
+
+
+def make_cache_key(*parts: str) -> str:
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _get_entry_path(cache_key: str):
+    # a sub folder per first two characters, to avoid folders with hundreds of thousands of files
+    return _render_cache_folder / cache_key[:2] / f"{cache_key}.json"
+
+
+def load_cached_render(cache_key: str):
+    """ Returns the entry saved with that key, or None if it is not in the cache"""
+    if _render_cache_folder is None:
+        return None
+
+    entry_path = _get_entry_path(cache_key)
+    try:
+        entry = json.loads(entry_path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return None
+
+    try:
+        os.utime(entry_path)  # so that it counts as recently used
+    except OSError:
+        pass  # it was evicted in the meantime, no big deal
+    return entry
+
+
+def save_cached_render(cache_key: str, entry: dict):
+    if _render_cache_folder is None:
+        return
+
+    entry_path = _get_entry_path(cache_key)
+    try:
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=entry_path.parent, suffix=".tmp")
+    except OSError as e:
+        logger.warning(f"WARNING: could not write to the render cache: {e}")
+        return
+
+    try:
+        with os.fdopen(file_descriptor, "w", encoding="utf-8") as file:
+            json.dump(entry, file, ensure_ascii=False)
+        os.replace(temporary_path, entry_path)
+    except OSError as e:
+        logger.warning(f"WARNING: could not write to the render cache: {e}")
+        try:
+            os.unlink(temporary_path)
+        except OSError:
+            pass
+
+
+def prune_render_cache(max_bytes: int = RENDER_CACHE_MAX_BYTES) -> int:
+    """
+    If the cache is bigger than max_bytes, deletes the least recently used entries
+    until it is 10% below the limit (so that it doesn't have to be pruned again at the next build).
+    Returns the number of deleted entries.
+    """
+    if _render_cache_folder is None or not _render_cache_folder.exists():
+        return 0
+
+    entries = []  # (last used, size, path)
+    deleted_count = 0
+    now = time.time()
+    for file_path in _render_cache_folder.glob("*/*"):
+        try:
+            file_stat = file_path.stat()
+        except OSError:
+            continue  # deleted by another process
+        if file_path.suffix == ".tmp":
+            if now - file_stat.st_mtime > _STALE_TEMPORARY_FILE_SECONDS:
+                file_path.unlink(missing_ok=True)
+            continue
+        entries.append((file_stat.st_mtime, file_stat.st_size, file_path))
+
+    total_size = sum(size for _, size, _ in entries)
+    if total_size <= max_bytes:
+        return 0
+
+    entries.sort(key=lambda entry: entry[0])
+    for _, size, file_path in entries:
+        if total_size <= max_bytes * 0.9:
+            break
+        try:
+            file_path.unlink()
+            deleted_count += 1
+        except FileNotFoundError:
+            pass  # another process evicted it already
+        total_size -= size
+
+    return deleted_count
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import re
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timezone
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+from index_output import LISTING_KEYS, SHARD_KEY, get_shard_path
+from paths import SEARCH_INDEX_PATH, LISTING_INDEX_PATH
+
+"""
+ The search of the website (search_results_script.js), in python, to query the catalogue from scripts
+ and to check the ranking without a browser.
+
+ It loads search_index.json and database_listing.json (made by the generator), and gives the same results as
+ doSearch: same filters, same points per field (SEARCH_FIELD_WEIGHTS), same minimum score of 2,
+ and the same order (highest score first, then the order of the index).
+ Only the best k results are sorted (np.argpartition finds them first).
+
+ For every field, the tokens of the postings are joined in a single string, so finding the tokens that contain a
+ word of the query is a few str.find calls instead of a loop over all the tokens.
+ The scores and the filters are numpy arrays with one value per dataset: the datasets of a token that is in
+ many of them are kept as a bitmap (so a word like "a", which is in most tokens, is a few ORs of bitmaps),
+ the other tokens as arrays of positions.
+
+ Usage (from the top-level directory):
+     python python_scripts/search.py "food survey" --location Scotland --category Nutrition -k 10
+     python python_scripts/search.py --serve 8001
+ The server answers GET /search?q=...&k=... with the same parameters as the url of the search page
+ (category=A,B, publiclyAvailable=true...), and returns json.
+"""
+
+MINIMUM_SCORE = 2
+DEFAULT_RESULT_COUNT = 20
+
+# the tokens of a field are joined with this, it can't be in a token or in a word of the query
+_TOKEN_SEPARATOR = "\n"
+
+_JS_DATE_RE = re.compile(r"^(\d{4})(?:-(\d{2})(?:-(\d{2}))?)?$")
+
+
+def preprocess_query(query: str) -> list[str]:
+    """ Same as preprocessQuery: lowercase words of the first 100 characters, at most 32 of them"""
+    return (query or "").strip().lower()[:100].split()[:32]
+
+
+def split_filter_text(text) -> list[str]:
+    """ The mandatory keywords and the file extensions are a single text, separated by ', '"""
+    return [value.strip().lower() for value in (text or "").split(", ") if value.strip()]
+
+
+def normalize_filter_values(values) -> list[str]:
+    values = [str(value).lower() for value in (values or [])]
+    # like isValidFilter, [""] is not a filter
+    if len(values) == 1 and not values[0].strip():
+        return []
+    return values
+
+
+def parse_date(date_str):
+    """ The dates of the index and of the filters are yyyy-mm-dd (or yyyy, yyyy-mm), like new Date(...) in UTC"""
+    match = _JS_DATE_RE.match(date_str or "")
+    if not match:
+        return None
+    year, month, day = int(match.group(1)), int(match.group(2) or 1), int(match.group(3) or 1)
+    try:
+        return datetime(year, month, day, tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def check_date(item_date_str, date_filter: dict) -> bool:
+    """ Same as checkDate: the datasets without a date, and the filters without a date, don't filter anything"""
+    if not date_filter or date_filter.get("type") == "ignore":
+        return True
+    item_date = parse_date(item_date_str)
+    filter_date = parse_date(date_filter.get("date"))
+    if item_date is None or filter_date is None:
+        return True
+    if date_filter.get("type") == "after":
+        return item_date >= filter_date
+    if date_filter.get("type") == "before":
+        return item_date <= filter_date
+    return True
+
+
+def date_filter_from_url_parameter(value) -> dict:
+    """ The collectionStart/collectionEnd parameter, like {"type":"after","date":"2012-01-01"}"""
+    date_filter = json.loads(value or '{"type":"ignore","date":""}')
+    if not isinstance(date_filter, dict) or not isinstance(date_filter.get("type"), str) \
+            or not isinstance(date_filter.get("date"), str):
+        raise ValueError(f"a date filter must be like {{\"type\":\"after\",\"date\":\"2012-01-01\"}}, not {value}")
+    return date_filter
+
+
+def filters_from_url_parameters(parameters: dict) -> dict:
+    """
+    Same as getFiltersFromParams, parameters is {name: value} (like the url of the search page).
+    Raises ValueError if a parameter can't be used.
+    """
+    publicly_available = parameters.get("publiclyAvailable")
+    return {
+        "mandatoryKeywords": parameters.get("mandatoryKeywords"),
+        # the search page always has it in its url, for the others a missing parameter doesn't filter
+        "publiclyAvailable": "" if publicly_available in ("", None) else publicly_available == "true",
+        "openForCollaboration": parameters.get("openForCollaboration") == "true",
+        "dataType": [value for value in (parameters.get("dataType") or "").split(",") if value],
+        "category": [value for value in (parameters.get("category") or "").split(",") if value],
+        "researchField": [value for value in (parameters.get("researchField") or "").split(",") if value],
+        "location": [value for value in (parameters.get("location") or "").split(",") if value],
+        "fileExtensions": parameters.get("fileExtensions") or "",
+        "collectionStart": date_filter_from_url_parameter(parameters.get("collectionStart")),
+        "collectionEnd": date_filter_from_url_parameter(parameters.get("collectionEnd")),
+    }
+
+
+class _FieldPostings:
+    """
+    The postings of a field: all the tokens in one string (to find the ones that contain a word),
+    and the datasets of every token. The tokens that are in many datasets are bitmaps of the datasets (a row of
+    dense_bitmaps), the others are their sorted positions, one after the other in sparse_positions.
+    """
+
+    def __init__(self, postings: dict, dataset_count: int):
+        self.dataset_count = dataset_count
+        self.token_starts = array("l")
+        joined_tokens = []
+        offset = 0
+        # a bitmap takes dataset_count / 8 bytes, 4 bytes per position otherwise
+        min_dense_length = max(1, dataset_count // 32)
+        dense_positions, sparse_positions = [], []
+        self.dense_rows = np.full(len(postings), -1, dtype=np.int64)
+        self.sparse_starts = np.zeros(len(postings), dtype=np.int64)
+        self.sparse_lengths = np.zeros(len(postings), dtype=np.int64)
+        sparse_length = 0
+        for token_number, (token, positions) in enumerate(postings.items()):
+            self.token_starts.append(offset)
+            joined_tokens.append(token)
+            offset += len(token) + len(_TOKEN_SEPARATOR)
+            if len(positions) >= min_dense_length:
+                self.dense_rows[token_number] = len(dense_positions)
+                dense_positions.append(positions)
+            else:
+                self.sparse_starts[token_number] = sparse_length
+                self.sparse_lengths[token_number] = len(positions)
+                sparse_positions.append(np.array(positions, dtype=np.int32))
+                sparse_length += len(positions)
+        self.joined_tokens = _TOKEN_SEPARATOR.join(joined_tokens)
+
+        self.dense_bitmaps = np.zeros((len(dense_positions), (dataset_count + 7) // 8), dtype=np.uint8)
+        for row, positions in enumerate(dense_positions):
+            self.dense_bitmaps[row] = np.packbits(_make_mask(positions, dataset_count))
+        self.sparse_positions = np.concatenate(sparse_positions) if sparse_positions else np.zeros(0, dtype=np.int32)
+
+    def find_matching_tokens(self, word: str):
+        """ The numbers of the tokens that contain word"""
+        search_start = 0
+        while True:
+            match_offset = self.joined_tokens.find(word, search_start)
+            if match_offset == -1:
+                return
+            token_number = bisect_right(self.token_starts, match_offset) - 1
+            yield token_number
+            # the next token, the same one can only count once
+            if token_number + 1 == len(self.token_starts):
+                return
+            search_start = self.token_starts[token_number + 1]
+
+    def get_matching_mask(self, word: str) -> np.ndarray:
+        """ True for the datasets that have a token that contains word"""
+        token_numbers = np.fromiter(self.find_matching_tokens(word), dtype=np.int64)
+        dense_rows = self.dense_rows[token_numbers]
+        dense_rows = dense_rows[dense_rows >= 0]
+        if len(dense_rows):
+            bitmap = np.bitwise_or.reduce(self.dense_bitmaps[dense_rows], axis=0)
+            mask = np.unpackbits(bitmap, count=self.dataset_count).view(bool)
+        else:
+            mask = np.zeros(self.dataset_count, dtype=bool)
+
+        # the positions of all the sparse tokens, without a python loop over the tokens
+        starts, lengths = self.sparse_starts[token_numbers], self.sparse_lengths[token_numbers]
+        position_count = int(lengths.sum())
+        if position_count:
+            offsets = np.arange(position_count) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            mask[self.sparse_positions[np.repeat(starts, lengths) + offsets]] = True
+        return mask
+
+
+def _make_mask(positions, dataset_count: int) -> np.ndarray:
+    mask = np.zeros(dataset_count, dtype=bool)
+    mask[np.asarray(positions, dtype=np.int64)] = True
+    return mask
+
+
+def _parse_dates(date_strs) -> np.ndarray:
+    """ The timestamps of the dates (see parse_date), NaN for the datasets without a valid date"""
+    dates = [parse_date(date_str) for date_str in date_strs]
+    return np.array([date.timestamp() if date is not None else np.nan for date in dates], dtype=np.float64)
+
+
+class SearchEngine:
+    def __init__(self, search_index: dict, listing: list[dict]):
+        records_by_id = dict()
+        for listing_entry in listing:
+            record = {attribute: listing_entry.get(short_key) for attribute, short_key in LISTING_KEYS.items()}
+            record["shard"] = listing_entry.get(SHARD_KEY)
+            records_by_id[record["id"]] = record
+
+        self.ids = search_index["ids"]
+        if any(dataset_id not in records_by_id for dataset_id in self.ids):
+            raise ValueError("search_index.json does not match database_listing.json")
+        self.records = [records_by_id[dataset_id] for dataset_id in self.ids]
+        dataset_count = len(self.ids)
+        self.field_weights = search_index["field_weights"]
+        self.field_postings = {field_name: _FieldPostings(search_index["postings"][field_name], dataset_count)
+                               for field_name in self.field_weights}
+        self.facets = {facet_name: {value: np.array(positions, dtype=np.int64)
+                                    for value, positions in facet_postings.items()}
+                       for facet_name, facet_postings in search_index["facets"].items()}
+        self.dates = {attribute: _parse_dates(record[attribute] for record in self.records)
+                      for attribute in ("collection_start", "collection_end")}
+        self._shards = dict()
+
+    @classmethod
+    def from_files(cls, search_index_path=SEARCH_INDEX_PATH, listing_path=LISTING_INDEX_PATH):
+        with open(search_index_path, "r", encoding="utf-8") as file:
+            search_index = json.load(file)
+        with open(listing_path, "r", encoding="utf-8") as file:
+            listing = json.load(file)
+        return cls(search_index, listing)
+
+    def _facet_mask(self, facet_name: str, values) -> np.ndarray:
+        """ True for the datasets that have one of the values"""
+        facet_postings = self.facets[facet_name]
+        positions = [facet_postings[value] for value in values if value in facet_postings]
+        return _make_mask(np.concatenate(positions) if positions else [], len(self.ids))
+
+    def filter_mask(self, filters: dict):
+        """ Same as filterDataWithIndex: True for the datasets that pass all the filters, None if nothing is filtered"""
+        masks = []
+
+        publicly_available = filters.get("publiclyAvailable", "")
+        if publicly_available != "":
+            if publicly_available is True or publicly_available is False:
+                masks.append(self._facet_mask("publicly_available", [str(publicly_available).lower()]))
+            else:
+                masks.append(np.zeros(len(self.ids), dtype=bool))
+
+        if filters.get("openForCollaboration"):
+            masks.append(self._facet_mask("open_for_collaboration", ["true"]))
+
+        for keyword in split_filter_text(filters.get("mandatoryKeywords")):
+            masks.append(self._facet_mask("keyword", [keyword]))
+
+        for filter_name, facet_name in (("dataType", "data_type"), ("category", "category"),
+                                        ("researchField", "research_field"), ("location", "location")):
+            filter_values = normalize_filter_values(filters.get(filter_name))
+            if filter_values:
+                masks.append(self._facet_mask(facet_name, filter_values))
+
+        file_extensions = split_filter_text(filters.get("fileExtensions"))
+        if file_extensions:
+            masks.append(self._facet_mask("file_extension", file_extensions))
+
+        for filter_name, attribute in (("collectionStart", "collection_start"), ("collectionEnd", "collection_end")):
+            date_filter = filters.get(filter_name)
+            if not date_filter or date_filter.get("type") not in ("after", "before"):
+                continue
+            filter_date = parse_date(date_filter.get("date"))
+            if filter_date is None:
+                continue
+            # like check_date, the datasets without a date are kept
+            item_dates = self.dates[attribute]
+            with np.errstate(invalid="ignore"):
+                is_in_range = item_dates >= filter_date.timestamp() if date_filter["type"] == "after" \
+                    else item_dates <= filter_date.timestamp()
+            masks.append(np.isnan(item_dates) | is_in_range)
+
+        if not masks:
+            return None
+        return np.logical_and.reduce(masks)
+
+    def filter_positions(self, filters: dict) -> list[int]:
+        """ The positions of the datasets that pass all the filters, in order"""
+        candidate_mask = self.filter_mask(filters)
+        if candidate_mask is None:
+            return list(range(len(self.ids)))
+        return np.flatnonzero(candidate_mask).tolist()
+
+    def score_datasets(self, words: list[str], candidate_mask=None) -> np.ndarray:
+        """ Same as scoreResultsWithIndex: the score of every dataset, 0 for the ones that are filtered out"""
+        if not words:
+            scores = np.full(len(self.ids), MINIMUM_SCORE, dtype=np.int32)
+        else:
+            scores = np.zeros(len(self.ids), dtype=np.int32)
+            for word in words:
+                for field_name, weight in self.field_weights.items():
+                    # a dataset gets the points of a field only once per word, even if several tokens contain it
+                    scores[self.field_postings[field_name].get_matching_mask(word)] += weight
+        if candidate_mask is not None:
+            scores[~candidate_mask] = 0
+        return scores
+
+    def search(self, query: str, filters: dict = None, k: int = DEFAULT_RESULT_COUNT) -> list[dict]:
+        """
+        The best k results of doSearch(query, filters), as [{"score": ..., "record": listing entry}].
+        filters has the same keys as in the javascript (see filters_from_url_parameters), missing keys don't filter.
+        """
+        scores = self.score_datasets(preprocess_query(query), self.filter_mask(filters or {}))
+        positions = np.flatnonzero(scores >= MINIMUM_SCORE)
+        # highest score first, then the order of the index (like the stable sort of sortAndFinalize)
+        sort_keys = (int(scores.max(initial=0)) - scores[positions]).astype(np.int64) * len(self.ids) + positions
+        if 0 < k < len(positions):
+            best = np.argpartition(sort_keys, k - 1)[:k]
+            positions, sort_keys = positions[best], sort_keys[best]
+        positions = positions[np.argsort(sort_keys)][:max(k, 0)]
+        return [{"score": int(scores[position]), "record": self.records[position]} for position in positions.tolist()]
+
+    def count_results(self, query: str, filters: dict = None) -> int:
+        scores = self.score_datasets(preprocess_query(query), self.filter_mask(filters or {}))
+        return int(np.count_nonzero(scores >= MINIMUM_SCORE))
+
+    def load_details(self, record: dict) -> dict:
+        """ The record with the rest of the attributes of the dataset (from its shard, like loadDetails)"""
+        shard_number = record["shard"]
+        if shard_number not in self._shards:
+            with open(get_shard_path(shard_number), "r", encoding="utf-8") as file:
+                self._shards[shard_number] = json.load(file)
+        return {**record, **self._shards[shard_number][record["id"]]}
+
+
+class _SearchRequestHandler(BaseHTTPRequestHandler):
+    def __init__(self, *args, search_engine: SearchEngine, **kwargs):
+        self.search_engine = search_engine
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/search":
+            self.send_error(404, "Use /search?q=...")
+            return
+        parameters = {name: values[0] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+        try:
+            filters = filters_from_url_parameters(parameters)
+            k = int(parameters.get("k", DEFAULT_RESULT_COUNT))
+        except ValueError as e:
+            self.send_error(400, f"Invalid parameters: {e}")
+            return
+
+        results = self.search_engine.search(parameters.get("q", ""), filters, k)
+        body = json.dumps({"query": parameters.get("q", ""), "results": results}, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Searches the catalogue like the search page of the website.")
+    parser.add_argument("query", nargs="?", default="")
+    parser.add_argument("-k", type=int, default=DEFAULT_RESULT_COUNT, help="number of results")
+    parser.add_argument("--category", action="append", default=[])
+    parser.add_argument("--location", action="append", default=[])
+    parser.add_argument("--data-type", action="append", default=[])
+    parser.add_argument("--research-field", action="append", default=[])
+    parser.add_argument("--keywords", default="", help="keywords that must all be present, separated by ', '")
+    parser.add_argument("--file-extensions", default="", help="separated by ', '")
+    parser.add_argument("--public", choices=["yes", "no"], help="only the publicly available ones, or the others")
+    parser.add_argument("--open-for-collaboration", action="store_true")
+    parser.add_argument("--after", help="collected after this date (yyyy-mm-dd)")
+    parser.add_argument("--before", help="collected before this date (yyyy-mm-dd)")
+    parser.add_argument("--details", action="store_true", help="also show the abstract of the results")
+    parser.add_argument("--json", action="store_true", help="print the results as json")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="answer queries on http://127.0.0.1:PORT/search")
+    args = parser.parse_args()
+
+    search_engine = SearchEngine.from_files()
+
+    if args.serve:
+        handler = partial(_SearchRequestHandler, search_engine=search_engine)
+        with ThreadingHTTPServer(("127.0.0.1", args.serve), handler) as server:
+            print(f"Answering queries on http://127.0.0.1:{args.serve}/search?q=... (Ctrl+C to stop)")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+        return
+
+    filters = {
+        "publiclyAvailable": {"yes": True, "no": False}.get(args.public, ""),
+        "openForCollaboration": args.open_for_collaboration,
+        "mandatoryKeywords": args.keywords,
+        "dataType": args.data_type,
+        "category": args.category,
+        "researchField": args.research_field,
+        "location": args.location,
+        "fileExtensions": args.file_extensions,
+        "collectionStart": {"type": "after", "date": args.after} if args.after else None,
+        "collectionEnd": {"type": "before", "date": args.before} if args.before else None,
+    }
+    results = search_engine.search(args.query, filters, args.k)
+    if args.details:
+        results = [{"score": result["score"], "record": search_engine.load_details(result["record"])}
+                   for result in results]
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    print(f"{search_engine.count_results(args.query, filters)} results, showing the best {len(results)}:")
+    for result in results:
+        record = result["record"]
+        print(f"{result['score']:4d}  {record['id']}  {record['name']}")
+        if args.details:
+            print(f"            {record.get('abstract', '')[:200]}")
+
+
+if __name__ == "__main__":
+    main()
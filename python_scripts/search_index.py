@@ -0,0 +1,161 @@
+from parse_dataset_information import filter_hierarchies
+
+"""
+ Makes the search index used by search_results_script.js, so that the browser doesn't have to scan every
+ dataset for every query.
+
+ The search index contains
+     * "ids": the dataset codes, a dataset is referred to by its position in this list
+     * "field_weights": the points that a dataset gets when a word of the query is in that field
+     * "postings": for every field, {token: [positions of the datasets that contain that token]}
+     * "facets": for every filter, {value: [positions of the datasets that have that value]}
+
+ The JS search matches a word of the query if it is *contained* in a field (name.includes(word)).
+ Since the words of the query never contain spaces, a word is contained in a field if and only if it is
+ contained in one of the space-separated tokens of that field, which is why the fields are split on whitespace.
+ The client then only has to look through the (much shorter) list of tokens.
+
+ The facet counts (facet_counts.json) are the number of allowed datasets for every option of filter_options.json,
+ with the datasets of the sub-options counted in their parents, so that the filters can show them without counting.
+"""
+
+# same weights as scoreResults in search_results_script.js
+SEARCH_FIELD_WEIGHTS = {
+    "name": 7,
+    "keywords": 5,
+    "abstract": 2,
+    "location": 3,
+    "author": 5,
+    "categories": 1,
+}
+
+# search field -> attribute of the index entry
+_SEARCH_FIELD_ATTRIBUTES = {
+    "name": "name",
+    "keywords": "keywords",
+    "abstract": "abstract",
+    "location": "location",
+    "author": "author_name",
+    "categories": "categories_list",
+}
+
+# filter of filter_options.json -> attribute of the index entry
+_FILTER_OPTIONS_ATTRIBUTES = {
+    "category": "categories_list",
+    "location": "location",
+    "dataType": "data_types",
+    "researchField": "research_fields",
+}
+
+# facet -> attribute of the index entry. These are the filters that are an exact match on a list of values
+_FACET_ATTRIBUTES = {
+    "category": "categories_list",
+    "research_field": "research_fields",
+    "data_type": "data_types",
+    "file_extension": "file_extensions",
+    "location": "location",
+    "keyword": "keywords",
+}
+
+
+def _as_list(value) -> list:
+    """ Fields can be a string (name) or a list of strings (keywords)"""
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def tokenize_field(value) -> set[str]:
+    """ Lowercase, whitespace separated tokens of a string or of a list of strings (like normalizeString/normalizeArray)"""
+    tokens = set()
+    for item in _as_list(value):
+        tokens.update(str(item).lower().split())
+    return tokens
+
+
+def normalize_facet_values(value) -> set[str]:
+    return {str(item).lower() for item in _as_list(value)}
+
+
+def _add_posting(postings: dict, key: str, position: int):
+    position_list = postings.setdefault(key, [])
+    # the positions are added in increasing order, so the lists stay sorted
+    if not position_list or position_list[-1] != position:
+        position_list.append(position)
+
+
+class SearchIndexBuilder:
+    """ Makes the search index (see the top of this file) from the entries of database_index.json given one by one"""
+
+    def __init__(self):
+        self.ids = []
+        self.postings = {field_name: dict() for field_name in SEARCH_FIELD_WEIGHTS}
+        self.facets = {facet_name: dict() for facet_name in _FACET_ATTRIBUTES}
+        self.facets["publicly_available"] = {"true": [], "false": []}
+        self.facets["open_for_collaboration"] = {"true": [], "false": []}
+
+    def add(self, entry: dict):
+        if not entry.get("allowed_in_database"):
+            return
+        position = len(self.ids)
+        self.ids.append(entry["id"])
+
+        for field_name, attribute in _SEARCH_FIELD_ATTRIBUTES.items():
+            for token in tokenize_field(entry.get(attribute)):
+                _add_posting(self.postings[field_name], token, position)
+
+        for facet_name, attribute in _FACET_ATTRIBUTES.items():
+            for facet_value in normalize_facet_values(entry.get(attribute)):
+                _add_posting(self.facets[facet_name], facet_value, position)
+
+        for facet_name in ("publicly_available", "open_for_collaboration"):
+            self.facets[facet_name]["true" if entry.get(facet_name) is True else "false"].append(position)
+
+    def build(self) -> dict:
+        # sorting the keys makes the file the same from one build to the next
+        return {
+            "ids": self.ids,
+            "field_weights": SEARCH_FIELD_WEIGHTS,
+            "postings": {field_name: dict(sorted(field_postings.items()))
+                         for field_name, field_postings in self.postings.items()},
+            "facets": {facet_name: dict(sorted(facet_postings.items()))
+                       for facet_name, facet_postings in self.facets.items()},
+        }
+
+
+def build_search_index(index_list: list[dict]) -> dict:
+    """ Makes the search index (see the top of this file) from the entries of database_index.json"""
+    search_index_builder = SearchIndexBuilder()
+    for entry in index_list:
+        search_index_builder.add(entry)
+    return search_index_builder.build()
+
+
+class FacetCounter:
+    """ Makes facet_counts.json from the entries of database_index.json given one by one"""
+
+    def __init__(self):
+        self.dataset_count = 0
+        # for every filter, how many datasets have exactly the options of a mask
+        self.mask_counts = {filter_name: dict() for filter_name in _FILTER_OPTIONS_ATTRIBUTES}
+
+    def add(self, entry: dict):
+        if not entry.get("allowed_in_database"):
+            return
+        self.dataset_count += 1
+        for filter_name, attribute in _FILTER_OPTIONS_ATTRIBUTES.items():
+            # not case sensitive, like the filters of the search page
+            mask = filter_hierarchies[filter_name].mask_of(map(str, _as_list(entry.get(attribute))), ignore_case=True)
+            filter_mask_counts = self.mask_counts[filter_name]
+            filter_mask_counts[mask] = filter_mask_counts.get(mask, 0) + 1
+
+    def build(self) -> dict:
+        """ {filter: {option: number of datasets}} for every option of filter_options.json, including the ones with 0"""
+        facet_counts = {"datasets": self.dataset_count, "counts": dict()}
+        for filter_name, filter_mask_counts in self.mask_counts.items():
+            hierarchy = filter_hierarchies[filter_name]
+            counts = hierarchy.count_per_option(filter_mask_counts)
+            facet_counts["counts"][filter_name] = dict(zip(hierarchy.option_names, counts))
+        return facet_counts
@@ -0,0 +1,88 @@
+import os
+import time
+
+from build_stats import logger
+
+"""
+ The loop of generate_website_content.py --watch: the process stays alive (with markdown imported,
+ filter_options.json loaded...), checks the files it depends on a few times per second, and rebuilds
+ when they change.
+
+ The files are polled (their modification time and size), which works everywhere and is cheap for a few files.
+ An editor often saves a file in several writes, so after a change the rebuild waits until the files
+ stopped changing for a little while (the debounce), instead of building from a half-written csv.
+"""
+
+POLL_SECONDS = 0.1
+DEBOUNCE_SECONDS = 0.3
+
+
+def get_file_signature(path):
+    """ Changes when the file is modified, None if the file doesn't exist (for example during a save)"""
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        return None
+    return file_stat.st_mtime_ns, file_stat.st_size
+
+
+def get_signatures(paths) -> dict:
+    return {path: get_file_signature(path) for path in paths}
+
+
+def wait_for_changes(paths, old_signatures: dict, poll_seconds: float = POLL_SECONDS,
+                     debounce_seconds: float = DEBOUNCE_SECONDS) -> (dict, list, float):
+    """
+    Waits until some of the files changed, and then stopped changing for debounce_seconds.
+    Returns the new signatures, the files that changed, and the time when the first change was seen.
+    """
+    while True:
+        time.sleep(poll_seconds)
+        new_signatures = get_signatures(paths)
+        if new_signatures != old_signatures:
+            break
+    first_change_time = time.perf_counter()
+
+    # wait for the end of the save
+    stable_since = time.perf_counter()
+    while time.perf_counter() - stable_since < debounce_seconds:
+        time.sleep(poll_seconds)
+        latest_signatures = get_signatures(paths)
+        if latest_signatures != new_signatures:
+            new_signatures = latest_signatures
+            stable_since = time.perf_counter()
+
+    changed_paths = [path for path in paths if new_signatures[path] != old_signatures.get(path)]
+    return new_signatures, changed_paths, first_change_time
+
+
+def watch_and_rebuild(paths, rebuild, poll_seconds: float = POLL_SECONDS, debounce_seconds: float = DEBOUNCE_SECONDS):
+    """
+    Calls rebuild(changed_paths) every time some of the files change, until Ctrl+C.
+    A failed rebuild (like a csv that is not valid yet) is reported, and the next change is waited for.
+    While a file is missing (an editor that saves by replacing the file), there is no rebuild either.
+    """
+    logger.info(f"Watching {', '.join(str(path) for path in paths)} for changes (Ctrl+C to stop)")
+    signatures = get_signatures(paths)
+    try:
+        while True:
+            signatures, changed_paths, first_change_time = wait_for_changes(paths, signatures, poll_seconds,
+                                                                            debounce_seconds)
+            logger.info(f"Changed: {', '.join(str(path) for path in changed_paths)}")
+            missing_paths = [path for path in paths if signatures[path] is None]
+            if missing_paths:
+                logger.warning(f"WARNING: {', '.join(str(path) for path in missing_paths)} not found, "
+                               f"waiting for the next change")
+                continue
+            rebuild_start_time = time.perf_counter()
+            try:
+                rebuild(changed_paths)
+            except (Exception, SystemExit) as e:
+                # SystemExit too: the scripts exit when a file is missing (see read_csv_safely._check_csv_exists)
+                logger.warning(f"WARNING: the rebuild failed, waiting for the next change: {e}")
+                continue
+            end_time = time.perf_counter()
+            logger.info(f"Rebuilt in {end_time - rebuild_start_time:.3f}s "
+                        f"({end_time - first_change_time:.3f}s since the change was seen)")
+    except KeyboardInterrupt:
+        logger.info("Stopped watching.")
@@ -0,0 +1,41 @@
+import re
+
+"""
+ The webpage template is a normal HTML file with placeholders such as {dataset_title}.
+
+ Instead of calling str.replace for every variable of every dataset (which copies the whole template each time),
+ the template is split once into the text between placeholders and the names of the placeholders.
+ Making a page is then a single join.
+"""
+
+# placeholders are {some_name}. The braces of the json+ld schema in the template never match this.
+_PLACEHOLDER_RE = re.compile(r"\{(\w+)\}")
+
+
+class CompiledTemplate:
+    def __init__(self, template_str: str):
+        # the template is literals[0] {placeholder_names[0]} literals[1] {placeholder_names[1]} ... literals[-1]
+        # re.split with a group alternates between the text and the group
+        segments = _PLACEHOLDER_RE.split(template_str)
+        self.literals = segments[0::2]
+        self.placeholder_names = segments[1::2]
+
+    def find_unknown_and_unused_placeholders(self, known_variable_names) -> (set[str], set[str]):
+        """ Returns the placeholders that no dataset variable will fill,
+        and the dataset variables that don't appear in the template"""
+        placeholders = set(self.placeholder_names)
+        known_variable_names = set(known_variable_names)
+        return placeholders - known_variable_names, known_variable_names - placeholders
+
+    def render(self, variables_dict: dict) -> str:
+        """
+        Fills in the placeholders with the items of variables_dict.
+        Like the old fill_in_gaps, only strings are filled in, the other placeholders are left as they are.
+        """
+        result_parts = []
+        for literal, placeholder_name in zip(self.literals, self.placeholder_names):
+            result_parts.append(literal)
+            value = variables_dict.get(placeholder_name)
+            result_parts.append(value if isinstance(value, str) else "{" + placeholder_name + "}")
+        result_parts.append(self.literals[-1])
+        return "".join(result_parts)
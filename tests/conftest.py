@@ -0,0 +1,9 @@
+import os
+import sys
+from pathlib import Path
+
+# the scripts use paths relative to the top-level directory (and read filter_options.json when imported)
+REPOSITORY_FOLDER = Path(__file__).resolve().parent.parent
+os.chdir(REPOSITORY_FOLDER)
+sys.path.insert(0, str(REPOSITORY_FOLDER / "python_scripts"))
+sys.path.insert(0, str(REPOSITORY_FOLDER / "benchmarks"))
@@ -0,0 +1,167 @@
+import json
+import shutil
+
+import pytest
+
+from benchmark_search import INDEX_PATH, QUERIES, FILTER_SETS, make_listing, run_javascript_searches
+from search import SearchEngine, filters_from_url_parameters
+from search_index import build_search_index, SEARCH_FIELD_WEIGHTS
+
+"""
+ search.py must give the same results as doSearch of search_results_script.js.
+ The first tests check the rules of the search in python, the last one compares with the javascript (with node),
+ with the search index and with the old scan of database_index.json.
+"""
+
+
+def make_entry(dataset_id: str, **attributes) -> dict:
+    entry = {
+        "id": dataset_id,
+        "allowed_in_database": True,
+        "name": "",
+        "keywords": [],
+        "abstract": "",
+        "publicly_available": True,
+        "author_name": "",
+        "location": [],
+        "collection_start": "",
+        "collection_end": "",
+        "categories_list": [],
+        "research_fields": [],
+        "data_types": [],
+        "file_extensions": [],
+        "open_for_collaboration": False,
+    }
+    entry.update(attributes)
+    return entry
+
+
+INDEX_LIST = [
+    make_entry("00001", name="Scottish food survey", keywords=["food", "diet"], abstract="Food eaten at home",
+               location=["Scotland", "UK"], categories_list=["Nutrition"], file_extensions=["csv"],
+               collection_start="2010-01-01", collection_end="2015-12-31"),
+    make_entry("00002", name="Farm census", keywords=["farming"], abstract="Livestock and crops",
+               author_name="Food Standards Scotland", location=["Scotland"], categories_list=["Agriculture"],
+               publicly_available=False, file_extensions=["xlsx"], collection_start="2018-06-01"),
+    make_entry("00003", name="Health records", keywords=["health"], abstract="Hospital admissions",
+               location=["Wales"], categories_list=["Health", "Food safety"], file_extensions=["csv", "xlsx"],
+               open_for_collaboration=True),
+    make_entry("00004", name="Diet diaries", keywords=["food", "diet"], abstract="Food diaries of children",
+               location=["England"], categories_list=["Nutrition"], collection_end="2009-01-01"),
+    make_entry("00005", name="Not allowed food", keywords=["food"], allowed_in_database=False),
+]
+
+NO_FILTERS = {"publiclyAvailable": ""}
+
+
+@pytest.fixture(scope="module")
+def search_engine() -> SearchEngine:
+    return SearchEngine(build_search_index(INDEX_LIST), make_listing(INDEX_LIST))
+
+
+def get_ids_and_scores(results: list) -> list:
+    return [(result["record"]["id"], result["score"]) for result in results]
+
+
+def test_every_field_has_its_weight(search_engine):
+    # "livestock" is only in the abstract of 00002, "census" only in its name...
+    for word, field_name, dataset_id in [("livestock", "abstract", "00002"), ("census", "name", "00002"),
+                                         ("farming", "keywords", "00002"), ("wales", "location", "00003"),
+                                         ("standards", "author", "00002")]:
+        assert get_ids_and_scores(search_engine.search(word, NO_FILTERS)) == \
+            [(dataset_id, SEARCH_FIELD_WEIGHTS[field_name])]
+
+
+def test_a_field_counts_once_per_word(search_engine):
+    # "food" is in the name, the keywords and the abstract of 00001 (twice in the abstract of 00004)
+    scores = dict(get_ids_and_scores(search_engine.search("food", NO_FILTERS)))
+    assert scores["00001"] == SEARCH_FIELD_WEIGHTS["name"] + SEARCH_FIELD_WEIGHTS["keywords"] + \
+        SEARCH_FIELD_WEIGHTS["abstract"]
+    assert scores["00004"] == SEARCH_FIELD_WEIGHTS["keywords"] + SEARCH_FIELD_WEIGHTS["abstract"]
+    # a word only has to be contained in a token, and every word of the query counts:
+    # "foo" is in the keywords and the abstract of 00004, "die" in its name and its keywords
+    assert dict(get_ids_and_scores(search_engine.search("foo die", NO_FILTERS)))["00004"] == \
+        SEARCH_FIELD_WEIGHTS["keywords"] + SEARCH_FIELD_WEIGHTS["abstract"] + \
+        SEARCH_FIELD_WEIGHTS["name"] + SEARCH_FIELD_WEIGHTS["keywords"]
+
+
+def test_results_below_the_minimum_score_are_dropped(search_engine):
+    # "safety" is only in the categories of 00003, which are worth 1 point
+    assert search_engine.search("safety", NO_FILTERS) == []
+    assert search_engine.count_results("safety", NO_FILTERS) == 0
+    # the datasets that are not allowed are not in the search index at all
+    assert "00005" not in dict(get_ids_and_scores(search_engine.search("food", NO_FILTERS)))
+
+
+def test_results_with_the_same_score_keep_the_order_of_the_index(search_engine):
+    assert get_ids_and_scores(search_engine.search("", NO_FILTERS)) == \
+        [("00001", 2), ("00002", 2), ("00003", 2), ("00004", 2)]
+    assert get_ids_and_scores(search_engine.search("", NO_FILTERS, k=2)) == [("00001", 2), ("00002", 2)]
+    # highest score first
+    assert [dataset_id for dataset_id, _ in get_ids_and_scores(search_engine.search("diet", NO_FILTERS))] == \
+        ["00004", "00001"]
+
+
+@pytest.mark.parametrize("filters, expected_ids", [
+    ({"publiclyAvailable": True}, ["00001", "00003", "00004"]),
+    ({"publiclyAvailable": False}, ["00002"]),
+    ({"publiclyAvailable": None}, []),
+    ({"publiclyAvailable": "", "openForCollaboration": True}, ["00003"]),
+    ({"publiclyAvailable": "", "category": ["Nutrition", "health"]}, ["00001", "00003", "00004"]),
+    ({"publiclyAvailable": "", "category": [""]}, ["00001", "00002", "00003", "00004"]),
+    ({"publiclyAvailable": "", "location": ["Scotland"], "category": ["Agriculture"]}, ["00002"]),
+    ({"publiclyAvailable": "", "mandatoryKeywords": "food, diet"}, ["00001", "00004"]),
+    ({"publiclyAvailable": "", "fileExtensions": "xlsx"}, ["00002", "00003"]),
+    # the datasets without a date are not filtered out
+    ({"publiclyAvailable": "", "collectionStart": {"type": "after", "date": "2012-01-01"}},
+     ["00002", "00003", "00004"]),
+    ({"publiclyAvailable": "", "collectionEnd": {"type": "before", "date": "2010"}}, ["00002", "00003", "00004"]),
+    ({"publiclyAvailable": "", "collectionEnd": {"type": "ignore", "date": "2010"}},
+     ["00001", "00002", "00003", "00004"]),
+])
+def test_filters(search_engine, filters, expected_ids):
+    assert [result["record"]["id"] for result in search_engine.search("", filters)] == expected_ids
+    assert search_engine.filter_positions(filters) == [int(dataset_id) - 1 for dataset_id in expected_ids]
+
+
+def test_url_parameters():
+    assert filters_from_url_parameters({})["publiclyAvailable"] == ""
+    assert filters_from_url_parameters({"publiclyAvailable": ""})["publiclyAvailable"] == ""
+    assert filters_from_url_parameters({"publiclyAvailable": "true"})["publiclyAvailable"] is True
+    assert filters_from_url_parameters({"publiclyAvailable": "false"})["publiclyAvailable"] is False
+    filters = filters_from_url_parameters({"category": "Nutrition,Health", "collectionStart":
+                                           '{"type":"after","date":"2012-01-01"}'})
+    assert filters["category"] == ["Nutrition", "Health"]
+    assert filters["collectionStart"] == {"type": "after", "date": "2012-01-01"}
+
+
+@pytest.mark.parametrize("date_filter", ["1", "[]", '"2012"', "null", '{"type":"after"}', '{"type":1,"date":"2012"}',
+                                         "{not json"])
+def test_bad_date_filters_are_rejected(date_filter):
+    with pytest.raises(ValueError):
+        filters_from_url_parameters({"collectionStart": date_filter})
+    with pytest.raises(ValueError):
+        filters_from_url_parameters({"collectionEnd": date_filter})
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+@pytest.mark.parametrize("index_list_name", ["test entries", "database_index.json"])
+@pytest.mark.parametrize("with_search_index", [True, False])
+def test_same_results_as_the_javascript(index_list_name, with_search_index):
+    if index_list_name == "database_index.json":
+        with open(INDEX_PATH, "r", encoding="utf-8") as file:
+            index_list = json.load(file)
+    else:
+        index_list = INDEX_LIST
+    search_index, listing = build_search_index(index_list), make_listing(index_list)
+    search_engine = SearchEngine(search_index, listing)
+
+    # without the search index, doSearch scans database_index.json (filterData and scoreResults, like before it)
+    if with_search_index:
+        javascript_results = run_javascript_searches({"search_index.json": search_index,
+                                                      "database_listing.json": listing})
+    else:
+        javascript_results = run_javascript_searches({"database_index.json": index_list})
+    python_results = [[result["record"]["id"] for result in search_engine.search(query, filters, k=len(listing))]
+                      for query in QUERIES for filters in FILTER_SETS]
+    assert python_results == javascript_results
@@ -7,13 +7,100 @@ let flexIndex = null;
 
 async function loadIndex() {
   if (indexData.length) return indexData;
-  const res = await fetch('../../website_metadata/database_index.json');
+  const res = await fetchMetadata('../../website_metadata/', 'database_index.json');
   indexData = await res.json();
   // Keep only entries where allowed_in_database is true
   indexData = indexData.filter(item => item.allowed_in_database);
   return indexData;
 }
 
+// The listing and the shards are made by python_scripts/index_output.py.
+// The listing has a few attributes of every dataset, with short keys. The rest is in the shards,
+// which are only loaded for the datasets that are shown.
+const LISTING_KEYS = {
+  i: "id",
+  n: "name",
+  p: "publicly_available",
+  c: "open_for_collaboration",
+  s: "collection_start",
+  e: "collection_end",
+  h: "shard",
+};
+
+async function loadListing() {
+  const res = await fetchMetadata('../../website_metadata/', 'database_listing.json');
+  if (!res.ok) throw new Error("Could not load database_listing.json");
+  const compactListing = await res.json();
+  return compactListing.map(entry => {
+    const item = {};
+    Object.entries(LISTING_KEYS).forEach(([shortKey, attribute]) => { item[attribute] = entry[shortKey]; });
+    return item;
+  });
+}
+
+// shard number -> promise of {id: details}, so that every shard is fetched only once
+const shardRequests = new Map();
+
+async function loadDetails(items) {
+  const shardNumbers = [...new Set(items.map(item => item.shard))];
+  shardNumbers.forEach(shardNumber => {
+    if (!shardRequests.has(shardNumber)) {
+      const shardName = `shard_${String(shardNumber).padStart(3, '0')}.json`;
+      shardRequests.set(shardNumber, fetchMetadata('../../website_metadata/', `index_shards/${shardName}`).then(res => {
+        if (!res.ok) throw new Error("Could not load " + shardName);
+        return res.json();
+      }));
+    }
+  });
+
+  try {
+    const shards = new Map();
+    for (const shardNumber of shardNumbers) {
+      shards.set(shardNumber, await shardRequests.get(shardNumber));
+    }
+    items.forEach(item => Object.assign(item, shards.get(item.shard)[item.id]));
+  } catch (err) {
+    // the results are still shown, just without keywords and abstract
+    console.warn("Could not load the details of the datasets:", err);
+  }
+  return items;
+}
+
+// The search index is made by python_scripts/search_index.py.
+// It contains the postings of every word and filter value, so that we don't have to scan every dataset.
+// If it can't be loaded, the search falls back to filterData and scoreResults on the whole database_index.json.
+let searchIndex = null;
+let searchIndexUnavailable = false;
+
+async function loadSearchIndex() {
+  if (searchIndex || searchIndexUnavailable) return searchIndex;
+  try {
+    const [res, listing] = await Promise.all([
+      fetchMetadata('../../website_metadata/', 'search_index.json'),
+      loadListing(),
+    ]);
+    if (!res.ok) throw new Error("Could not load search_index.json");
+    const loadedIndex = await res.json();
+
+    // the datasets are referred to by their position in loadedIndex.ids
+    const recordsById = new Map(listing.map(item => [item.id, item]));
+    loadedIndex.records = loadedIndex.ids.map(id => recordsById.get(id));
+    if (loadedIndex.records.some(item => item === undefined)) {
+      throw new Error("search_index.json does not match database_listing.json");
+    }
+    // [token, positions] pairs, so that they are not recomputed for every word of the query
+    loadedIndex.postingEntries = {};
+    Object.keys(loadedIndex.field_weights).forEach(field => {
+      loadedIndex.postingEntries[field] = Object.entries(loadedIndex.postings[field]);
+    });
+    searchIndex = loadedIndex;
+  } catch (err) {
+    console.warn("Searching without the search index:", err);
+    searchIndexUnavailable = true;
+  }
+  return searchIndex;
+}
+
 
 // --- Top-Level Helper Functions ---
 
@@ -257,6 +344,115 @@ function scoreResults(filteredData, tokens) {
   });
 }
 
+/**
+ * Union of the postings of some filter values, as a Set of positions.
+ */
+const unionPostings = (facetPostings, values) => {
+  const positions = new Set();
+  values.forEach(value => (facetPostings[value] || []).forEach(position => positions.add(position)));
+  return positions;
+};
+
+/**
+ * Same as filterData, but using the postings of the search index.
+ * Returns the positions (in index.ids) of the datasets that pass all filters, in increasing order.
+ */
+function filterDataWithIndex(index, filters) {
+  let candidates = index.ids.map((_, position) => position);
+  const keepOnly = (positions) => {
+    candidates = candidates.filter(position => positions.has(position));
+  };
+  const facets = index.facets;
+
+  // --- 1. Filter: Shareability ---
+  const fPublic = filters.publiclyAvailable;
+  if (fPublic !== "") {
+    // same as item.publicly_available === fPublic
+    if (fPublic === true || fPublic === false) {
+      keepOnly(new Set(facets.publicly_available[String(fPublic)]));
+    } else {
+      candidates = [];
+    }
+  }
+
+  if (filters.openForCollaboration) {
+    keepOnly(new Set(facets.open_for_collaboration["true"]));
+  }
+
+  const fMandatoryKeywords = (filters.mandatoryKeywords || '')
+    .split(', ')
+    .map(s => s.trim().toLowerCase())
+    .filter(Boolean);
+  if (isValidFilter(fMandatoryKeywords)) {
+    // every keyword must be present
+    fMandatoryKeywords.forEach(keyword => keepOnly(unionPostings(facets.keyword, [keyword])));
+  }
+
+  // --- 2. to 5. Filters: Kinds of data, Category, Research field, Location ---
+  [
+    [filters.dataType, facets.data_type],
+    [filters.category, facets.category],
+    [filters.researchField, facets.research_field],
+    [filters.location, facets.location],
+  ].forEach(([filterValues, facetPostings]) => {
+    const fValues = normalizeArray(filterValues);
+    if (isValidFilter(fValues)) {
+      keepOnly(unionPostings(facetPostings, fValues));
+    }
+  });
+
+  // --- 6. Filter: File Extensions ---
+  const fFileExtensions = (filters.fileExtensions || '')
+    .split(', ')
+    .map(s => s.trim().toLowerCase())
+    .filter(Boolean);
+  if (isValidFilter(fFileExtensions)) {
+    keepOnly(unionPostings(facets.file_extension, fFileExtensions));
+  }
+
+  // --- 7. and 8. Filters: Collection start and end (only on the datasets that are left) ---
+  if (filters.collectionStart && filters.collectionStart.type !== "ignore") {
+    candidates = candidates.filter(position =>
+      checkDate(index.records[position].collection_start, filters.collectionStart)
+    );
+  }
+  if (filters.collectionEnd && filters.collectionEnd.type !== "ignore") {
+    candidates = candidates.filter(position =>
+      checkDate(index.records[position].collection_end, filters.collectionEnd)
+    );
+  }
+
+  dbg("After filtering with the search index there are " + candidates.length + " items");
+  return candidates;
+}
+
+/**
+ * Same as scoreResults, but using the postings of the search index.
+ * A word of the query matches a field if it is contained in one of the tokens of that field.
+ */
+function scoreResultsWithIndex(index, candidates, tokens) {
+  if (tokens.length === 0) {
+    return candidates.map(position => ({ item: index.records[position], score: 2 }));
+  }
+
+  const scores = new Map(candidates.map(position => [position, 0]));
+
+  tokens.forEach(t => {
+    Object.entries(index.field_weights).forEach(([field, weight]) => {
+      // a dataset gets the points of a field only once per word, even if several tokens contain it
+      const matchingPositions = new Set();
+      index.postingEntries[field].forEach(([token, positions]) => {
+        if (token.includes(t)) positions.forEach(position => matchingPositions.add(position));
+      });
+      matchingPositions.forEach(position => {
+        if (scores.has(position)) scores.set(position, scores.get(position) + weight);
+      });
+    });
+  });
+
+  return candidates.map(position => ({ item: index.records[position], score: scores.get(position) }));
+}
+
 /**
  * 3. Filters by minimum score, sorts, and returns final items.
  */
@@ -275,13 +471,21 @@ function sortAndFinalize(scoredData) {
  * @param {object} filters An object of filters to apply.
  */
 async function doSearch(q, filters = {}) {
-  // 0. Load data
-  // Note: loadIndex() is assumed to be defined elsewhere.
-  const data = await loadIndex();
-
   // 1. Prepare search query
   const tokens = preprocessQuery(q);
 
+  // With the search index, filtering and scoring only look at the postings and the listing,
+  // and the rest of the information is only loaded for the results
+  const index = await loadSearchIndex();
+  if (index) {
+    const candidates = filterDataWithIndex(index, filters);
+    const results = sortAndFinalize(scoreResultsWithIndex(index, candidates, tokens));
+    return loadDetails(results);
+  }
+
+  // 0. Load data
+  const data = await loadIndex();
+
   // 2. Apply all filters to get a reduced dataset
   const filteredData = filterData(data, filters);
 
@@ -410,9 +614,10 @@ function fakeClickOnOption(filterLabel, selectedOption) {
     return;
   }
 
-  // Find the matching <option> by text (case-insensitive match)
+  // Find the matching <option> by text or value (case-insensitive match),
+  // the text of the filter options also has the number of datasets
   const option = Array.from(select.options).find(opt =>
-    opt.textContent.trim().toLowerCase() === selectedOption.trim().toLowerCase()
+    [opt.textContent, opt.value].some(text => text.trim().toLowerCase() === selectedOption.trim().toLowerCase())
   );
 
   if (!option) {
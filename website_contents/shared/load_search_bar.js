@@ -136,7 +136,7 @@ function initSearchLogic(websiteContentsPath = '') {
 
 
 
-function loadFilterOptionsForFilter(json_data, filter_name) {
+function loadFilterOptionsForFilter(json_data, filter_name, optionCounts = null) {
   // Find the <select> element
   const selectElement = document.getElementById(filter_name);
   if (!selectElement) {
@@ -151,8 +151,7 @@ function loadFilterOptionsForFilter(json_data, filter_name) {
   function addOptionsToList(list, obj, depth = 0) {
     for (const key in obj) {
       if (Object.hasOwn(obj, key)) {
-        const label = `${'&nbsp;&nbsp;'.repeat(depth)}${key}`;
-        list.push(label);
+        list.push({ key, depth });
         addOptionsToList(list, obj[key], depth + 1);
       }
     }
@@ -163,13 +162,28 @@ function loadFilterOptionsForFilter(json_data, filter_name) {
   addOptionsToList(menuEntries, json_data);
 
   // Add each entry to the <select>
-  menuEntries.forEach(entry => {
+  menuEntries.forEach(({ key, depth }) => {
     const option = document.createElement("option");
-    option.innerHTML = entry; // render &nbsp; as indentation
+    // the value is the indented name, the text also has the number of datasets (precomputed in facet_counts.json)
+    option.value = '\u00a0\u00a0'.repeat(depth) + key;
+    const count = optionCounts ? optionCounts[key] : undefined;
+    option.textContent = count === undefined ? option.value : `${option.value} (${count})`;
     selectElement.appendChild(option);
   });
 }
 
+async function loadFacetCounts(websiteContentsPath = '') {
+  // the counts are optional: without them the filters just don't show the numbers
+  try {
+    const response = await fetchMetadata(`${websiteContentsPath}../website_metadata/`, 'facet_counts.json');
+    if (!response.ok) throw new Error("Could not load facet_counts.json");
+    return (await response.json()).counts;
+  } catch (error) {
+    console.warn("Error loading the facet counts:", error);
+    return {};
+  }
+}
+
 /**
  * Load all filters dynamically from a JSON file.
  * The JSON should look like:
@@ -182,14 +196,15 @@ function loadFilterOptionsForFilter(json_data, filter_name) {
 async function loadFilterOptions(websiteContentsPath = '') {
   // loads the filter_options file and populates the options for various filters
   try {
-    const response = await fetch(`${websiteContentsPath}../website_metadata/filter_options.json`);
+    const response = await fetchMetadata(`${websiteContentsPath}../website_metadata/`, 'filter_options.json');
     if (!response.ok) throw new Error("Could not load filter_options.json");
     const filterOptionsDict = await response.json();
+    const facetCounts = await loadFacetCounts(websiteContentsPath);
 
     // Load each filter dynamically
     ["category", "location", "dataType", "researchField"].forEach(filterName => {
       if (filterOptionsDict[filterName]) {
-        loadFilterOptionsForFilter(filterOptionsDict[filterName], filterName);
+        loadFilterOptionsForFilter(filterOptionsDict[filterName], filterName, facetCounts[filterName]);
       } else {
         console.warn(`Filter '${filterName}' not found in JSON.`);
       }
@@ -0,0 +1,31 @@
+// The generator writes a copy of the files of website_metadata with the hash of their content in the name,
+// listed in asset_manifest.json (see python_scripts/asset_manifest.py).
+// A copy never changes, so the browser can keep it in its cache: only the (small) manifest is checked at every visit.
+
+let assetManifestRequest = null;
+
+function loadAssetManifest(metadataPath) {
+  if (!assetManifestRequest) {
+    assetManifestRequest = fetch(`${metadataPath}asset_manifest.json`, { cache: "no-cache" })
+      .then(res => (res.ok ? res.json() : { files: {} }))
+      .catch(() => ({ files: {} }));
+  }
+  return assetManifestRequest;
+}
+
+/**
+ * Fetches a file of website_metadata (like "database_listing.json" or "index_shards/shard_000.json"),
+ * using its hashed copy when there is one.
+ * @param {string} metadataPath The path of the website_metadata folder, ending with a "/".
+ * @param {string} fileName The usual name of the file, relative to website_metadata.
+ */
+async function fetchMetadata(metadataPath, fileName) {
+  const manifest = await loadAssetManifest(metadataPath);
+  const file = (manifest.files || {})[fileName];
+  if (file) {
+    const res = await fetch(metadataPath + file.path);
+    if (res.ok) return res;
+  }
+  // no manifest (like in the preview server), or an old one: the file is fetched by its usual name
+  return fetch(metadataPath + fileName);
+}